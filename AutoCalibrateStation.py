@@ -0,0 +1,238 @@
+from CamContext import CamContext
+from CameraStartUpJsonTemplate import *
+from CamControls import get_controls_path
+from CamRoi import get_roi_profile_path
+
+import argparse
+import logging
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from prettytable import PrettyTable
+
+class BotSlot:
+    """
+    cameras of one bot connected to the same usb hub, calibrated by its own AutoCalibrate process in its own directory.
+    """
+    def __init__(self,slot_id,hub_path,see_cams,slot_dir):
+        self.slot_id = slot_id
+        self.hub_path = hub_path
+        self.see_cams = see_cams
+        self.slot_dir = slot_dir
+        self.json_path = os.path.join(slot_dir,"CameraStartUpJson.json")
+        self.log_path = os.path.join(slot_dir,"AutoCalibrate.log")
+        # created by AutoCalibrate of the slot once recording is done and cameras are released
+        self.recording_done_path = os.path.join(slot_dir,"RecordingDone")
+        self.process = None
+        self.return_code = None
+        self.start_time = None
+        self.recording_end_time = None
+        self.end_time = None
+
+    @property
+    def usb_bus(self):
+        return get_usb_bus(self.hub_path)
+
+    @property
+    def is_recording(self):
+        """
+        slot holds usb bandwidth till its recording is done or its process has exited.
+        """
+        return self.recording_end_time is None and self.end_time is None
+
+class AutoCalibrateStation:
+    """
+    Calibrates several bots connected to one host at the same time.
+    Cameras are grouped into bot slots by the usb hub they are connected to (udev ID_PATH),
+    every slot runs AutoCalibrate non interactively with its own data directory and CameraStartUpJson.
+    Number of slots running together is limited overall (cpu budget) and per usb bus (bandwidth budget).
+    """
+
+    def __init__(self):
+
+        logging.basicConfig(format="[%(asctime)s, %(levelname)s] %(message)s", level=logging.INFO, datefmt="%d/%m/%y %H:%M:%S")
+        self.logger = logging.getLogger()
+
+        parser = argparse.ArgumentParser(description = "Script to calibrate multiple bots at the same time. \n ./AutoCalibrateStation --videoplayback_build ./VideoPlayback_ECON_vx.y.z --bot_type 1 --path_width 60 --lane_colour 0 \n params not listed here are passed to AutoCalibrate of every slot",formatter_class=argparse.RawTextHelpFormatter)
+
+        parser.add_argument("--videoplayback_build",type = str,required = True,help = "path to VideoPlayback build.")
+        parser.add_argument("--bot_type",type = int,required = True,choices = [1,2],help = "BotType of the bots calibrated in station.")
+        parser.add_argument("--path_width",type = int,required = True,help = "PathWidth in cm.")
+        parser.add_argument("--lane_colour",type = int,required = True,help = "LaneColourToScan.")
+        parser.add_argument("--cams_per_bot",type = int,default = 3,help = "number of cameras connected to each bot. (default : 3)")
+        parser.add_argument("--json_path",type = str,default = "/home/pi/CameraStartUpJson.json",help = "CameraStartUpJson copied to every slot , template is used if not present. (default : /home/pi/CameraStartUpJson.json)")
+        parser.add_argument("--station_dir",type = str,default = None,help = "directory to create slot directories in. (default : None , AutoCalibStation_<timestamp> in current directory)")
+        parser.add_argument("--max_parallel_slots",type = int,default = max(1,(os.cpu_count() or 1) // 2),help = "max number of slots calibrated at the same time. (default : half the number of cpu cores)")
+        parser.add_argument("--max_slots_per_bus",type = int,default = 1,help = "max number of slots recording at the same time on one usb bus. (default : 1)")
+        parser.add_argument("--script",type = str,default = os.path.join(os.path.dirname(os.path.abspath(__file__)),"AutoCalibrate.py"),help = "AutoCalibrate script run for every slot. (default : AutoCalibrate.py)")
+
+        self.args , self.slot_args = parser.parse_known_args()
+
+        self.station_dir = self.args.station_dir or os.path.join(os.getcwd(),"AutoCalibStation"+"_"+datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+        os.makedirs(self.station_dir,exist_ok = True)
+
+        self.cam_context = CamContext()
+        self.slots = []
+
+    def configure_slots(self):
+        """
+        group the seecams by usb hub into bot slots, hubs with other than cams_per_bot cameras are not calibrated.
+        """
+        see_cams = self.cam_context.get_seecam()
+        if see_cams == None:
+            self.logger.error("!!! No Cameras Found !!!")
+            sys.exit()
+
+        cams_by_hub = defaultdict(list)
+        for cam in see_cams:
+            cams_by_hub[get_hub_path(cam.usb_path)].append(cam)
+
+        for hub_path in sorted(cams_by_hub.keys()):
+            hub_cams = cams_by_hub[hub_path]
+            if len(hub_cams) != self.args.cams_per_bot:
+                self.logger.warning(f"{len(hub_cams)} cameras found on hub {hub_path} , expected {self.args.cams_per_bot} , hub is skipped")
+                continue
+
+            slot_id = len(self.slots) + 1
+            slot_dir = os.path.join(self.station_dir,f"slot{slot_id}")
+            os.makedirs(slot_dir,exist_ok = True)
+            self.slots.append(BotSlot(slot_id,hub_path,hub_cams,slot_dir))
+
+        if len(self.slots) == 0:
+            self.logger.error("!!! No bot found with all the cameras on one hub !!!")
+            sys.exit()
+
+        slot_info_table = PrettyTable()
+        slot_info_table.field_names = ["Slot","Hub","Cameras"]
+        for slot in self.slots:
+            slot_info_table.add_row([slot.slot_id,slot.hub_path,", ".join(f"{cam.serial_number} ({cam.camera_index})" for cam in slot.see_cams)])
+        print(slot_info_table)
+
+    def prepare_slot_json(self,slot):
+        """
+        every slot gets its own copy of CameraStartUpJson, updated and backed up by AutoCalibrate of the slot.
+        """
+        if os.path.exists(self.args.json_path):
+            with open(self.args.json_path,"r") as station_json:
+                slot_json = json.load(station_json)
+        else:
+            slot_json = CameraStartUpJsonTemplate
+
+        with open(slot.json_path,"w") as slot_json_file:
+            json.dump(slot_json,slot_json_file,indent = 4)
+
+    def get_slot_cmd(self,slot):
+        return [sys.executable,self.args.script,
+                "--json_path",slot.json_path,
+                "--serials",",".join(cam.serial_number for cam in slot.see_cams),
+                "--n_cam",str(len(slot.see_cams)),
+                "--bot_type",str(self.args.bot_type),
+                "--path_width",str(self.args.path_width),
+                "--lane_colour",str(self.args.lane_colour),
+                "--videoplayback_build",os.path.abspath(self.args.videoplayback_build),
+                # locked controls and roi profiles are kept next to station json , so they are reused across runs
+                "--controls_path",get_controls_path(self.args.json_path),
+                "--roi_profile_path",get_roi_profile_path(self.args.json_path),
+                "--recording_done_path",slot.recording_done_path,
+                "--non_interactive"] + self.slot_args
+
+    def start_slot(self,slot):
+        """
+        run AutoCalibrate of the slot in slot directory, data directory and json backups are created there.
+        """
+        self.prepare_slot_json(slot)
+        # marker left by an earlier run in same station directory
+        if os.path.exists(slot.recording_done_path):
+            os.remove(slot.recording_done_path)
+        slot.start_time = time.monotonic()
+        with open(slot.log_path,"w") as slot_log:
+            slot.process = subprocess.Popen(self.get_slot_cmd(slot),cwd = slot.slot_dir,stdin = subprocess.DEVNULL,stdout = slot_log,stderr = subprocess.STDOUT)
+        self.logger.info(f"Started slot {slot.slot_id} on hub {slot.hub_path} , log : {slot.log_path}")
+
+    def can_start_slot(self,slot,running_slots):
+        if len(running_slots) >= self.args.max_parallel_slots:
+            return False
+        # slots done with recording only process the videos and leave the usb bus free
+        return sum(running_slot.usb_bus == slot.usb_bus and running_slot.is_recording for running_slot in running_slots) < self.args.max_slots_per_bus
+
+    def run(self):
+        """
+        run all the slots, a slot is started as soon as it fits in the budget.
+        """
+        self.configure_slots()
+
+        placement_input = input(f"Enter y when all the {len(self.slots)} BOTs are positioned properly [predefined calibration position] , n to exit : ")
+        while placement_input not in ["y","n"]:
+            placement_input = input(f"Enter y when all the {len(self.slots)} BOTs are positioned properly [predefined calibration position] , n to exit : ")
+        if placement_input == "n":
+            sys.exit()
+
+        pending_slots = list(self.slots)
+        running_slots = []
+
+        while len(pending_slots) or len(running_slots):
+            for slot in list(pending_slots):
+                if self.can_start_slot(slot,running_slots):
+                    self.start_slot(slot)
+                    pending_slots.remove(slot)
+                    running_slots.append(slot)
+
+            for slot in list(running_slots):
+                if slot.recording_end_time is None and os.path.exists(slot.recording_done_path):
+                    slot.recording_end_time = time.monotonic()
+                    self.logger.info(f"Slot {slot.slot_id} finished recording , usb bus {slot.usb_bus} is free for next slot")
+                if slot.process.poll() is not None:
+                    slot.return_code = slot.process.returncode
+                    slot.end_time = time.monotonic()
+                    running_slots.remove(slot)
+                    self.logger.info(f"Slot {slot.slot_id} finished with return code {slot.return_code}")
+
+            time.sleep(0.5)
+
+        self.print_result()
+
+    def print_result(self):
+        result_table = PrettyTable()
+        result_table.field_names = ["Slot","Hub","Status","Time [s]","Log"]
+        for slot in self.slots:
+            status = "Done" if slot.return_code == 0 else f"Failed ({slot.return_code})"
+            result_table.add_row([slot.slot_id,slot.hub_path,status,round(slot.end_time - slot.start_time,1),slot.log_path])
+        print(result_table)
+
+    def stop(self):
+        for slot in self.slots:
+            if slot.process is not None and slot.process.poll() is None:
+                slot.process.terminate()
+
+def get_hub_path(usb_path):
+    """
+    ID_PATH of the hub the device is connected to, last port of usb port chain is removed.
+    platform-fd500000.pcie-pci-0000:01:00.0-usb-0:1.2.3:1.0 -> platform-fd500000.pcie-pci-0000:01:00.0-usb-0:1.2
+    """
+    match = re.match(r"^(.*-usb-\d+:)([\d.]+)(:[\d.]+)?$",usb_path or "")
+    if match is None:
+        return usb_path
+    ports = match.group(2).split(".")
+    return match.group(1) + ".".join(ports[:-1] or ports)
+
+def get_usb_bus(usb_path):
+    """
+    ID_PATH of the usb bus (root hub) the device is connected to.
+    """
+    match = re.match(r"^(.*-usb-\d+)",usb_path or "")
+    return match.group(1) if match is not None else usb_path
+
+if __name__ == "__main__":
+
+    station = AutoCalibrateStation()
+    try:
+        station.run()
+    except KeyboardInterrupt:
+        print("------ exiting ----------")
+    finally:
+        station.stop()
@@ -1,6 +1,10 @@
 from CamContext import CamContext
 from MarkerDetector import ArucoMarkerDetector
+from CamMarkerVote import MarkerVote , get_mapping_report_table
 from CamWriter import CameraWriter
+from CamRecorder import CameraRecorder
+from CamCapture import CameraCaptureError
+from CamSegmentPlayback import SegmentPlayback
 from ParseParams import *
 from CameraStartUpJsonTemplate import *
 from AutoCalibResult import *
@@ -17,21 +21,30 @@ from prettytable import PrettyTable
 import socket
 
 
-class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult):
+class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult,CameraRecorder,SegmentPlayback):
     
     def __init__(self):
         
         ParseParams.__init__(self)
         CamContext.__init__(self)
-        ArucoMarkerDetector.__init__(self,self.args.aruco_dict)
+        ArucoMarkerDetector.__init__(self,self.args.aruco_dict,detect_scale = self.args.detect_scale,track_roi = self.args.track_marker_roi)
         AutoCalibResult.__init__(self)
+        CameraRecorder.__init__(self)
+        SegmentPlayback.__init__(self)
         
         
         ### configure seecam ###
         self.configure_seecams()
         ########################
         
+        ### pick resolution from cached camera benchmark ###
+        if self.args.auto_resolution:
+            self.select_benchmarked_resolution()
+        ####################################################
+        
         self.current_json = None
+        # lock for read-modify-write of CameraStartUpJson
+        self.startup_json_lock = threading.RLock()
         
         # check if all the required params are provided from cli
         # else print the appropriate log and exit.
@@ -49,11 +62,11 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         self.data_dir = os.path.join(os.getcwd(),self.bot_name+"_"+"AutoCalibData"+"_"+datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
         # create directory to writer log and video 
         os.mkdir(self.data_dir)
+        # videos are recorded and played back from staging dir if enabled , set up once region of interest of BotType is known
+        self.video_dir = self.data_dir
         ##############################################
         
         ########## param for video recording ##########
-        # count to skip frames that is of green color
-        self.skip_frame_count = 3
         # count to keep track of frames being written
         self.current_frame_count = 1
         ###############################################
@@ -123,21 +136,27 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
     
     def update_param_in_camera_startup_json(self,ParamType,**kwargs):
         
-        # read the current version of CameraStartUpJson
-        with open(self.args.json_path,"r") as existing_json_path:
-            existing_json_file = json.load(existing_json_path)
+        # json is also updated by segment playback worker , one read-modify-write at a time
+        with self.startup_json_lock:
             
-        # update the required params
-        for key,val in kwargs.items():
-            existing_json_file[ParamType][0][key] = val
+            # read the current version of CameraStartUpJson
+            with open(self.args.json_path,"r") as existing_json_path:
+                existing_json_file = json.load(existing_json_path)
                 
-        # write the update verison of CameraStartUpJson
-        with open(self.args.json_path,"w") as updated_json_path:
-            json.dump(existing_json_file,updated_json_path,indent=4)
-            
-        # after updating json file, update current json file
-        with open(self.args.json_path,"r") as updated_curr_json:
-            self.current_json = json.load(updated_curr_json)
+            # update the required params
+            for key,val in kwargs.items():
+                existing_json_file[ParamType][0][key] = val
+                    
+            # write the update verison of CameraStartUpJson into temporary file and replace
+            # so VideoPlayback build never reads half written json
+            tmp_json_path = self.args.json_path + ".tmp"
+            with open(tmp_json_path,"w") as updated_json_path:
+                json.dump(existing_json_file,updated_json_path,indent=4)
+            os.replace(tmp_json_path,self.args.json_path)
+                
+            # after updating json file, update current json file
+            with open(self.args.json_path,"r") as updated_curr_json:
+                self.current_json = json.load(updated_curr_json)
         
     def configure_camera_startup_json(self):
         """
@@ -153,7 +172,8 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
             # if CameraStartUpJson is already present ask the user, if it has to backed up
             self.logger.info("**** This Script overwrites the current json file for updating params , Take backup of current json file before proceeding if needed ****")
             
-            bkp_choice = input(f"{self.get_formatted_timestamp()} Enter y to take backup , n to skip : ")
+            # in non interactive mode (station slot) backup is always taken
+            bkp_choice = "y" if self.args.non_interactive else input(f"{self.get_formatted_timestamp()} Enter y to take backup , n to skip : ")
             
             # while taking input, check for proper input 
             while bkp_choice not in ["y","n"]:
@@ -198,8 +218,11 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         print(bot_type_info_table)
         ###############################################################
         
-        ##### get input from user for BotType #####
-        bot_type = int(input(f"{self.get_formatted_timestamp()} Enter BotType : "))
+        ##### get input from user for BotType , unless provided from cli #####
+        if self.args.bot_type is not None:
+            bot_type = self.args.bot_type
+        else:
+            bot_type = int(input(f"{self.get_formatted_timestamp()} Enter BotType : "))
         
         ## failsafe to make user choose bot_type out of available list ##
         while bot_type not in [1,2]:
@@ -213,7 +236,10 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         """
         get PathWidth in cm from user and update in CameraStartUpJson
         """
-        path_width_input = int(input(f"{self.get_formatted_timestamp()} Enter PathWidth [in cm]: "))
+        if self.args.path_width is not None:
+            path_width_input = self.args.path_width
+        else:
+            path_width_input = int(input(f"{self.get_formatted_timestamp()} Enter PathWidth [in cm]: "))
         
         # Update the PathWidth in CameraStartUpJson
         self.update_param_in_camera_startup_json(ParamType = "DebugParams",PathWidth = path_width_input)
@@ -222,7 +248,10 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         """
         get LaneColourToScan from user and update it in CameraStartUpJson
         """
-        lane_colour_input = int(input(f"{self.get_formatted_timestamp()} Enter LaneColor : "))
+        if self.args.lane_colour is not None:
+            lane_colour_input = self.args.lane_colour
+        else:
+            lane_colour_input = int(input(f"{self.get_formatted_timestamp()} Enter LaneColor : "))
         
         # update the lane colour in CameraStartUpJson
         self.update_param_in_camera_startup_json(ParamType="CamParams",LaneColourToScan=lane_colour_input)
@@ -230,7 +259,11 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
     def configue_bot_placement(self):
         """
         get conformation from user regarding, whether the bot is placed and it's good to continue auto calibration.
+        in non interactive mode the placement is confirmed by the station before starting.
         """
+        if self.args.non_interactive:
+            return
+        
         bot_placement_input = input(f"{self.get_formatted_timestamp()} Enter y when BOT is positioned properly [predefined calibration position] , n to exit : ")
         
         while bot_placement_input not in ["y","n"]:
@@ -252,6 +285,11 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         # scan the camera and get camera serial numbers
         self.see_cams = self.get_seecam()
         
+        # in station mode only the cameras of current bot are used
+        if self.see_cams is not None and self.args.serials is not None:
+            serials = self.args.serials.split(",")
+            self.see_cams = [cam for cam in self.see_cams if cam.serial_number in serials] or None
+        
         # if no cameras found exit with error message
         if self.see_cams == None:
             self.logger.error("!!! No Cameras Found !!!")
@@ -288,62 +326,68 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         # mainatin predefined markers to avoid false detection
         predefined_marker_ids = [self.args.front_cam_marker_id,self.args.right_cam_marker_id,self.args.left_cam_marker_id]
         
-        # utility function to conver list of list of ids to list of id
-        def get_id_from_ids(ids):
-            id = ids[0]
-            
-            if len(id) > 1:
-                self.logger.error(f"more than 1 marker detected")
-                sys.exit()
-            else:
-                return id[0]
+        # camera name and CameraStartUpJson param of each predefined marker id
+        cam_by_marker_id = {self.args.front_cam_marker_id : ("FrontCam","frontCameraId"),
+                            self.args.right_cam_marker_id : ("RightCam","rightCameraId"),
+                            self.args.left_cam_marker_id  : ("LeftCam","leftCameraId")}
+        # serial number of camera mapped to each marker id , the same marker must not be mapped to two cameras
+        serial_by_marker_id = dict()
+        # serial number -> votes of camera , for confidence report
+        marker_votes = dict()
+        # (camera , reason) of cameras not mapped , given up once all the mapped cameras are updated in json
+        unmapped_cams = []
+        
+        # all the cameras have to be mapped within mapping deadline
+        mapping_deadline = time.monotonic() + self.args.mapping_deadline
         
         # iterate over seecam object and detect markers
         for cam in self.see_cams:
-            # get the current cam index , fetch frame and detect marker
-            cap = cv2.VideoCapture(cam.camera_index)
-            
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH,self.w)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT,self.h)
-            cap.set(cv2.CAP_PROP_BUFFERSIZE,1)
-            cap.set(cv2.CAP_PROP_FPS,15)
+            # get the grabber running on current cam , fetch frames and vote for marker
+            cap = self.get_camera_capture(cam.serial_number)
+            # yuyv frames are detected on luma plane without decoding
+            luma_capture = self.start_luma_capture(cap)
             
+            marker_vote = MarkerVote(predefined_marker_ids,window_size = self.args.mapping_window,required_votes = self.args.mapping_votes)
+            marker_votes[cam.serial_number] = marker_vote
             
-            # flag to check if id is detected for current cam
-            id_detected = False
+            # marker has to be detected within mapping timeout of camera and mapping deadline
+            cam_deadline = min(time.monotonic() + self.args.mapping_timeout,mapping_deadline)
             
-            while not id_detected:
+            while marker_vote.marker_id is None:
                 
-                ret , frame = cap.read()
+                remaining_time = cam_deadline - time.monotonic()
+                if remaining_time <= 0:
+                    break
                 
-                if ret:
-                    # detect the marker in current camera
-                    _ , ids , _ , _ = self.get_marker_id(frame)
-                    if ids != None:
-                        # since the ids returned is list of list of ids
-                        # convert this into single list of one id
-                        current_marker_id = get_id_from_ids(ids)
-                        # check the id and assign the camera index to corresponding camere name
-                        # and update id in json file
-                        if current_marker_id in predefined_marker_ids:
-                            if current_marker_id == self.args.front_cam_marker_id:
-                                self.logger.info(f"Detected Marker Id {current_marker_id} in {cam.serial_number}")
-                                self.update_param_in_camera_startup_json(ParamType="CamParams",frontCameraId=cam.serial_number)
-                                self.cam_name_and_index["FrontCam"] = cam.camera_index
-                                id_detected = True
-                            if current_marker_id == self.args.right_cam_marker_id:
-                                self.logger.info(f"Detected Marker Id {current_marker_id} in {cam.serial_number}")
-                                self.update_param_in_camera_startup_json(ParamType="CamParams",rightCameraId=cam.serial_number)
-                                self.cam_name_and_index["RightCam"] = cam.camera_index
-                                id_detected = True
-                            if current_marker_id == self.args.left_cam_marker_id:
-                                self.logger.info(f"Detected Marker Id {current_marker_id} in {cam.serial_number}")
-                                self.update_param_in_camera_startup_json(ParamType="CamParams",leftCameraId=cam.serial_number)
-                                self.cam_name_and_index["LeftCam"] = cam.camera_index
-                                id_detected = True
-                            
-            if id_detected:
-                cap.release()
+                # detect the marker in the frames waiting in ring , stop as soon as the votes agree
+                for frame in self.read_frame_batch(cap,self.args.mapping_batch,timeout = remaining_time):
+                    _ , ids , _ = self.detect_marker_ids(frame,track_key = cam.serial_number,frame_size = (self.w,self.h))
+                    if marker_vote.add(ids) is not None:
+                        break
+            
+            if luma_capture:
+                self.stop_luma_capture(cap)
+            
+            current_marker_id = marker_vote.marker_id
+            if current_marker_id is None:
+                report = marker_vote.get_report()
+                unmapped_cams.append((cam,f"marker not detected in {report['time']} s , leading marker id {report['leading_id']} with {report['votes']}/{report['window']} votes"))
+                continue
+            if current_marker_id in serial_by_marker_id:
+                unmapped_cams.append((cam,f"marker id {current_marker_id} is already mapped to {serial_by_marker_id[current_marker_id]}"))
+                continue
+            serial_by_marker_id[current_marker_id] = cam.serial_number
+            
+            # assign the camera index to corresponding camera name and update id in json file
+            cam_name , cam_id_param = cam_by_marker_id[current_marker_id]
+            self.logger.info(f"Detected Marker Id {current_marker_id} in {cam.serial_number}")
+            self.update_param_in_camera_startup_json(ParamType="CamParams",**{cam_id_param : cam.serial_number})
+            self.cam_name_and_index[cam_name] = cam.camera_index
+        
+        print(get_mapping_report_table(marker_votes))
+        
+        for cam , reason in unmapped_cams:
+            self.give_up_camera(cam,reason)
                 
                 
         self.logger.info(f"Mapped Camera Id's FrontCameraId : {self.current_json['CamParams'][0]['frontCameraId']} | RightCameraId : {self.current_json['CamParams'][0]['rightCameraId']} | LeftCameraId : {self.current_json['CamParams'][0]['leftCameraId']}")
@@ -370,34 +414,28 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         """
         
         # initialize cam writer object
-        out = CameraWriter(self.data_dir,self.w,self.h)
-        for cam_name , cam_index in self.cam_name_and_index.items():
-            cap = cv2.VideoCapture(cam_index)
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH,self.w)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT,self.h)
-            cap.set(cv2.CAP_PROP_BUFFERSIZE,1)
-            cap.set(cv2.CAP_PROP_FPS,15)
-            
-            while self.current_frame_count <= self.args.record_frame_count:
-                ret , frame = cap.read()
-                if ret:
-                    if self.current_frame_count > self.skip_frame_count:
-                        out.write_image(cam_name,frame)
-                        
-                        #### print progress of writing frames ######
-                        self.log_progress(f"{self.get_formatted_timestamp()} Recording Video Of {cam_name} [{self.current_frame_count}/{self.args.record_frame_count} frames]")
-                        # End of, print progress of writing frames #
-                        
-                    self.current_frame_count += 1
-            self.current_frame_count = 0
+        out = CameraWriter(self.video_dir,self.w,self.h,self.cam_name_and_index,
+                           on_segment_complete = self.queue_segment_for_playback,
+                           record_rois = self.get_record_rois(self.cam_name_and_index.keys()))
+        if self.args.sync_capture:
+            # record all the cameras with frames grabbed at the same instant
+            self.record_videos_synchronized(self.cam_name_and_index,out)
+        elif self.args.concurrent_recording:
+            # record all the cameras at the same time
+            self.record_videos_concurrently(self.cam_name_and_index,out)
+        else:
+            # record one camera after another
+            self.record_videos_sequentially(self.cam_name_and_index,out)
         # release the video writer objects
         out.clear_writer()
+        # copy the recordings to data dir in background
+        self.flush_staged_recordings()
         
         #### in debug mode ####
         ## if testing in debug mode where lane is not available in bench testing, copy the existing video from another dir and continue with rest of the logic.
         if self.args.debug:
             src_dir = "/home/pi/auto_calib_debug_data/"
-            dest_dir = self.data_dir
+            dest_dir = self.video_dir
             # shutil.copy(src_dir,dest_dir)
             if os.path.exists(dest_dir):
                 os.system(f"sudo rm -rf {dest_dir}")
@@ -438,24 +476,24 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         self.progress_done.clear()
 
         # get log file name for resptective camera and update SelectCameraForOfflineMode in CameraStartUpJson
-        if video_file == self.args.front_cam_video_name:
+        if video_file == self.get_video_file_name("FrontCam",playback = True):
             log_file = os.path.join(self.data_dir,self.log_file_name[mode]["front"])    
             self.update_param_in_camera_startup_json(ParamType = "DebugParams",SelectCameraForOfflineMode = 0)
             
-        if video_file == self.args.right_cam_video_name:
+        if video_file == self.get_video_file_name("RightCam",playback = True):
             log_file = os.path.join(self.data_dir,self.log_file_name[mode]["right"])
             self.update_param_in_camera_startup_json(ParamType = "DebugParams",SelectCameraForOfflineMode = 1)
             
-        if video_file == self.args.left_cam_video_name:
+        if video_file == self.get_video_file_name("LeftCam",playback = True):
             log_file = os.path.join(self.data_dir,self.log_file_name[mode]["left"])
             self.update_param_in_camera_startup_json(ParamType = "DebugParams",SelectCameraForOfflineMode = 2)
             
         # get absolute path to video file
-        video_file = os.path.join(self.data_dir,video_file)
+        video_file = os.path.join(self.video_dir,video_file)
         
         # check if the video file exists #
-        if len(os.listdir(self.data_dir)) < self.args.n_cam:
-            self.logger.error(f"Only {len(os.listdir(self.data_dir))} exists out of {self.args.n_cam}")
+        if len(os.listdir(self.video_dir)) < self.args.n_cam:
+            self.logger.error(f"Only {len(os.listdir(self.video_dir))} exists out of {self.args.n_cam}")
             
         ########### execute videoplayback build ########################
         # Start the progress indicator thread
@@ -486,12 +524,23 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         Param:
         mode : 0->without ratio and steering offset, 1->with ratio and without steering offset , 2->with ratio and with steering offset
         """
+        # segments are played back and their logs are merged into log file of each camera
+        if self.is_segmented_recording():
+            if not self.generate_segment_logs(mode):
+                sys.exit()
+            return
+        
         # update HostCommnflag :0 and HybridSwitch : false in CameraStartUpJson before running VideoPlayback with offline videos
         self.update_param_in_camera_startup_json(ParamType = "DebugParams",HostCommnFlag = 0,HybridSwitch = False)
         
+        # raw recordings are converted to mp4 only once, before the first execution of VideoPlayback build
+        if self.args.record_format == "raw":
+            self.convert_raw_recordings(self.video_dir)
+            self.flush_staged_recordings()
+        
         # iterate over front,left and right video files in directory and execute videoplayback build and generate log files
-        for video_file in os.listdir(self.data_dir):
-            if ".mp4" in video_file:
+        for video_file in os.listdir(self.video_dir):
+            if self.playback_ext_dict[self.args.record_format] in video_file:
                 self.execute_videoplayback_build(video_file,mode)
                 
     def get_ratio_csa_from_log_file(self,log_file_path):
@@ -889,6 +938,7 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         auto_calib_data_dict[self.bot_name]["front"]["steering_angle_offset"] = self.Front.STEERING_OFFSET
         auto_calib_data_dict[self.bot_name]["front"]["ratio_with_offset"] = self.Front.RATIO_WITH_OFFSET
         auto_calib_data_dict[self.bot_name]["front"]["steering_angle_with_offset"] = self.Front.STEERING_ANGLE_WITH_OFFSET
+        auto_calib_data_dict[self.bot_name]["front"]["capture_telemetry"] = self.capture_telemetry.get("FrontCam")
         
         auto_calib_data_dict[self.bot_name]["right"]["camera_id"] = self.cam_name_and_index["RightCam"]
         auto_calib_data_dict[self.bot_name]["right"]["ratio_without_offset"] = self.Right.RATIO_WITHOUT_OFFSET
@@ -897,6 +947,7 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         auto_calib_data_dict[self.bot_name]["right"]["steering_angle_offset"] = self.Right.STEERING_OFFSET
         auto_calib_data_dict[self.bot_name]["right"]["ratio_with_offset"] = self.Right.RATIO_WITH_OFFSET
         auto_calib_data_dict[self.bot_name]["right"]["steering_angle_with_offset"] = self.Right.STEERING_ANGLE_WITH_OFFSET
+        auto_calib_data_dict[self.bot_name]["right"]["capture_telemetry"] = self.capture_telemetry.get("RightCam")
         
         auto_calib_data_dict[self.bot_name]["left"]["camera_id"] = self.cam_name_and_index["LeftCam"]
         auto_calib_data_dict[self.bot_name]["left"]["ratio_without_offset"] = self.Left.RATIO_WITHOUT_OFFSET
@@ -905,6 +956,7 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         auto_calib_data_dict[self.bot_name]["left"]["steering_angle_offset"] = self.Left.STEERING_OFFSET
         auto_calib_data_dict[self.bot_name]["left"]["ratio_with_offset"] = self.Left.RATIO_WITH_OFFSET
         auto_calib_data_dict[self.bot_name]["left"]["steering_angle_with_offset"] = self.Left.STEERING_ANGLE_WITH_OFFSET
+        auto_calib_data_dict[self.bot_name]["left"]["capture_telemetry"] = self.capture_telemetry.get("LeftCam")
         
         ### open a json file save data ###
         with open(os.path.join(self.data_dir,self.auto_calib_data_json),"w") as res_json:
@@ -933,10 +985,19 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         self.configure_path_width()
         #########################################################
         
+        ############# Open all the cameras once ##############
+        self.open_cameras()
+        #######################################################
+        
         ############# configure bot placement in predefined calibration position ###########
         self.configue_bot_placement()
         ####################################################################################
         
+        ############# Start capturing as soon as the bot is placed ##############
+        if self.args.preroll_seconds > 0:
+            self.start_preroll_capture()
+        #########################################################################
+        
         ############# Perform Camera Id Mapping ###############
         if self.args.skip_camera_id_mapping:
             # display to user about skipping camera device id mapping
@@ -946,11 +1007,20 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         #######################################################
         
         ############ Record Video ####################
+        self.video_dir = self.setup_staging(self.data_dir)
+        # with segmented recording VideoPlayback runs on completed segments while recording
+        if self.is_segmented_recording():
+            self.start_segment_playback()
         self.record_video()
+        # cameras are not needed after recording
+        self.release_cameras()
+        self.notify_recording_done()
         ##############################################
         
         ######## Before Executing Videoplayback build overwrite existing offsets with zero #######
-        self.overwrite_existing_offset()
+        # with segmented recording offsets are overwritten by start_segment_playback , before the worker started
+        if not self.is_segmented_recording():
+            self.overwrite_existing_offset()
         ##########################################################################################
         
         
@@ -999,6 +1069,10 @@ class AutoCalibrateV2(ParseParams,CamContext,ArucoMarkerDetector,AutoCalibResult
         self.save_autocalibrate_result_as_json()
         #############################################################
         
+        ##### wait till the staged recordings are copied to data dir #####
+        self.finish_staging()
+        ##################################################################
+        
         ##########################################################################################
         
     
@@ -1008,4 +1082,9 @@ if __name__ == "__main__":
     try:
         auto_calib.run_calibration()
     except KeyboardInterrupt:
-        print("------ exiting ----------")
\ No newline at end of file
+        print("------ exiting ----------")
+    except CameraCaptureError as e:
+        auto_calib.logger.error(str(e))
+    finally:
+        auto_calib.release_cameras()
+        auto_calib.finish_staging()
\ No newline at end of file
@@ -0,0 +1,231 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy
+
+from CamContext import CamContext
+from CamProfile import CaptureProfile , CameraCaptureProfiles
+
+# resolution of camera , same modes as --resolution
+BenchmarkResolutions = {
+    0 : (640,480),
+    1 : (960,540),
+    2 : (1280,720),
+    3 : (1280,960),
+    4 : (1920,1080)
+}
+
+def get_cache_key(serial_number,usb_path,fourcc):
+    """
+    results are cached per camera, usb port and pixel format, the same camera on other hub port or
+    with other pixel format (uncompressed YUYV needs more bandwidth than MJPG) can sustain different modes.
+    """
+    return f"{serial_number}@{usb_path}#{fourcc}"
+
+def get_pixel_format(cam_model,fourcc = None):
+    """
+    pixel format cameras are opened with , fourcc from cli or from capture profile of camera model.
+    """
+    if fourcc is not None:
+        return fourcc
+    return CameraCaptureProfiles.get(cam_model,CameraCaptureProfiles["Default"])["fourcc"]
+
+def load_benchmark_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return dict()
+    with open(cache_path,"r") as cache_file:
+        return json.load(cache_file)
+
+def get_best_resolution(cache_path,see_cams,fourcc,min_fps_ratio = 0.9,max_failure_rate = 0.01):
+    """
+    highest resolution which every camera has sustained with pixel format fourcc while all the cameras were streaming together.
+    a mode is safe if achieved fps is at least min_fps_ratio of requested fps and failure rate is at most max_failure_rate.
+    returns None if any of the camera is not benchmarked on its current port or no mode is safe.
+    """
+    cache = load_benchmark_cache(cache_path)
+
+    cam_results = []
+    for cam in see_cams:
+        cam_result = cache.get(get_cache_key(cam.serial_number,cam.usb_path,fourcc))
+        # cameras streaming together in benchmark should be at least as many as connected now
+        if cam_result is None or cam_result["concurrent_cam_count"] < len(see_cams):
+            return None
+        cam_results.append(cam_result)
+
+    def is_safe(mode_result):
+        return (mode_result is not None and
+                mode_result["fps"] >= min_fps_ratio * mode_result["requested_fps"] and
+                mode_result["failure_rate"] <= max_failure_rate)
+
+    safe_resolutions = [resolution for resolution in BenchmarkResolutions.keys()
+                        if all(is_safe(cam_result["modes"].get(str(resolution),{}).get("concurrent")) for cam_result in cam_results)]
+
+    return max(safe_resolutions) if len(safe_resolutions) else None
+
+class CameraBenchmark:
+    """
+    Walks every resolution for each seecam and measures achieved fps, read latency and failure rate,
+    first with the camera streaming alone and then with all the cameras streaming together.
+    """
+
+    def __init__(self,see_cams,cam_model,fourcc = None,duration = 5.0,warmup = 1.0):
+
+        self.logger = logging.getLogger()
+
+        self.see_cams = see_cams
+        self.cam_model = cam_model
+        # pixel format is resolved , so results are cached with the format actually requested
+        self.fourcc = get_pixel_format(cam_model,fourcc)
+        # seconds of frames measured for each mode , after skipping warmup seconds of frames
+        self.duration = duration
+        self.warmup = warmup
+
+    def measure_camera(self,cap,results,serial_number):
+        """
+        read frames from opened camera for duration and store the stats in results.
+        """
+        warmup_end = time.monotonic() + self.warmup
+        while time.monotonic() < warmup_end:
+            cap.read()
+
+        frame_count = 0
+        failure_count = 0
+        read_latencies_ms = []
+
+        start_time = time.monotonic()
+        end_time = start_time + self.duration
+        while time.monotonic() < end_time:
+            read_start = time.monotonic()
+            ret , _ = cap.read()
+            read_latencies_ms.append((time.monotonic() - read_start) * 1000)
+            if ret:
+                frame_count += 1
+            else:
+                failure_count += 1
+        elapsed = time.monotonic() - start_time
+
+        read_latencies_ms = numpy.array(read_latencies_ms)
+        results[serial_number] = {
+            "fps"             : round(frame_count / elapsed,2),
+            "failure_rate"    : round(failure_count / max(1,frame_count + failure_count),4),
+            "read_mean_ms"    : round(float(read_latencies_ms.mean()),2) if len(read_latencies_ms) else None,
+            "read_p95_ms"     : round(float(numpy.percentile(read_latencies_ms,95)),2) if len(read_latencies_ms) else None
+        }
+
+    def benchmark_mode(self,cams,resolution):
+        """
+        open the given cameras at resolution and measure all of them at the same time.
+        returns serial number -> stats , cameras which can not be opened are not in result.
+        """
+        width , height = BenchmarkResolutions[resolution]
+        profile = CaptureProfile(self.cam_model,width,height,fourcc = self.fourcc)
+
+        captures = dict()
+        for cam in cams:
+            cap = profile.open(cam.camera_index)
+            if not cap.isOpened():
+                self.logger.error(f"!!! Failed to open camera {cam.serial_number} at {cam.camera_index} !!!")
+                continue
+            granted = profile.verify(cap,cam.serial_number)
+            # driver has fallen back to other mode, result would not be of requested resolution
+            if (granted["width"],granted["height"]) != (width,height):
+                cap.release()
+                continue
+            captures[cam.serial_number] = cap
+
+        results = dict()
+        workers = [threading.Thread(target = self.measure_camera,args = (cap,results,serial_number)) for serial_number , cap in captures.items()]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        for cap in captures.values():
+            cap.release()
+
+        for serial_number in results.keys():
+            results[serial_number]["requested_fps"] = profile.fps
+        return results
+
+    def run(self):
+        """
+        benchmark every resolution alone and together, returns cache key -> result of camera.
+        """
+        cam_results = {get_cache_key(cam.serial_number,cam.usb_path,self.fourcc) : {
+                            "serial_number"        : cam.serial_number,
+                            "usb_path"             : cam.usb_path,
+                            "cam_model"            : self.cam_model,
+                            "fourcc"               : self.fourcc,
+                            "concurrent_cam_count" : len(self.see_cams),
+                            "benchmarked_on"       : datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            "modes"                : dict()
+                       } for cam in self.see_cams}
+
+        for resolution , (width , height) in BenchmarkResolutions.items():
+            solo_results = dict()
+            for cam in self.see_cams:
+                self.logger.info(f"Benchmarking {cam.serial_number} at {width}x{height} alone")
+                solo_results.update(self.benchmark_mode([cam],resolution))
+
+            self.logger.info(f"Benchmarking {len(self.see_cams)} cameras at {width}x{height} together")
+            concurrent_results = self.benchmark_mode(self.see_cams,resolution)
+
+            for cam in self.see_cams:
+                cam_results[get_cache_key(cam.serial_number,cam.usb_path,self.fourcc)]["modes"][str(resolution)] = {
+                    "width"      : width,
+                    "height"     : height,
+                    "solo"       : solo_results.get(cam.serial_number),
+                    "concurrent" : concurrent_results.get(cam.serial_number)
+                }
+
+        return cam_results
+
+    def print_results(self,cam_results):
+        for cam_result in cam_results.values():
+            self.logger.info(f"##### {cam_result['serial_number']} on {cam_result['usb_path']} with {cam_result['fourcc']} #####")
+            for mode in cam_result["modes"].values():
+                for run in ("solo","concurrent"):
+                    stats = mode[run]
+                    if stats is None:
+                        self.logger.info(f"{mode['width']}x{mode['height']} {run} : not supported")
+                    else:
+                        self.logger.info(f"{mode['width']}x{mode['height']} {run} : fps {stats['fps']} , read mean {stats['read_mean_ms']} ms , read p95 {stats['read_p95_ms']} ms , failure rate {stats['failure_rate']}")
+
+    def save_results(self,cam_results,cache_path):
+        """
+        merge the results into cache, results of cameras not connected now are kept.
+        """
+        cache = load_benchmark_cache(cache_path)
+        cache.update(cam_results)
+        with open(cache_path,"w") as cache_file:
+            json.dump(cache,cache_file,indent = 4)
+
+if __name__ == "__main__":
+
+    logging.basicConfig(format="[%(asctime)s, %(levelname)s] %(message)s", level=logging.INFO, datefmt="%d/%m/%y %H:%M:%S")
+    logger = logging.getLogger()
+
+    # benchmark the connected seecams : python CamBenchmark.py [--duration 5]
+    parser = argparse.ArgumentParser(description = "Benchmark the resolutions supported by connected seecams alone and all together.")
+    parser.add_argument("--duration",type = float,default = 5.0,help = "seconds to measure each mode. (default : 5.0)")
+    parser.add_argument("--pixel_format",type = str,default = None,choices = ["MJPG","YUYV"],help = "pixel format to request from camera. (default : None , pixel format from capture profile of camera model)")
+    parser.add_argument("--benchmark_cache",type = str,default = "/home/pi/CameraBenchmark.json",help = "path to json file where results are cached. (default : /home/pi/CameraBenchmark.json)")
+    args = parser.parse_args()
+
+    cam_context = CamContext()
+    see_cams = cam_context.get_seecam()
+    if see_cams == None:
+        logger.error("!!! No Cameras Found !!!")
+    else:
+        benchmark = CameraBenchmark(see_cams,cam_context.cam_model,fourcc = args.pixel_format,duration = args.duration)
+        cam_results = benchmark.run()
+        benchmark.print_results(cam_results)
+        benchmark.save_results(cam_results,args.benchmark_cache)
+
+        best_resolution = get_best_resolution(args.benchmark_cache,see_cams,benchmark.fourcc)
+        logger.info(f"Best resolution for all the cameras together : {best_resolution} {BenchmarkResolutions.get(best_resolution)}")
@@ -1,17 +1,79 @@
-import cv2 
+import cv2
+import numpy
 import threading
-import queue
+import time
+import logging
+from collections import namedtuple
+
+from CamTelemetry import CaptureTelemetry
+
+# frames of all the cameras grabbed at the same instant
+# frames : cam name -> read-only frame view , grab_timestamps : cam name -> monotonic time of grab
+# grab_spread_ms : time between first and last grab of the set
+FrameSet = namedtuple("FrameSet",["seq","frames","grab_timestamps","grab_spread_ms"])
+
+class CameraCaptureError(Exception):
+    """
+    raised when camera has not delivered a frame within reconnect timeout, or has not responded within its watchdog budget.
+    """
+    def __init__(self,serial_number,camera_index,reason,failure_count = 0):
+
+        self.serial_number = serial_number
+        self.camera_index = camera_index
+        self.reason = reason
+        self.failure_count = failure_count
+        failed_reads = f" after {failure_count} failed reads" if failure_count else ""
+        super().__init__(f"!!! Camera {serial_number} at {camera_index} : {reason}{failed_reads} !!!")
+
+class CaptureBackoff:
+    """
+    exponential backoff between retries of a failing camera, gives up after timeout seconds without a frame.
+    """
+    def __init__(self,timeout = 10.0,min_delay = 0.05,max_delay = 2.0):
+
+        self.timeout = timeout
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.reset()
+
+    def reset(self):
+        # monotonic time of first failure of current streak , None when the camera is delivering frames
+        self.failure_start = None
+        self.delay = self.min_delay
+        self.retry_count = 0
+
+    def is_expired(self):
+        return self.failure_start is not None and time.monotonic() - self.failure_start > self.timeout
+
+    def wait(self):
+        """
+        sleep before next retry, returns the number of retries done in current streak including this one.
+        """
+        if self.failure_start is None:
+            self.failure_start = time.monotonic()
+        time.sleep(self.delay)
+        self.delay = min(2 * self.delay,self.max_delay)
+        self.retry_count += 1
+        return self.retry_count
 
 class CameraCapture(threading.Thread):
-    def __init__(self, camera_index = 0, queue_size=10 , resolution = 0 , serial_num = None):
-        
-        super().__init__()
-        self.queue = queue.Queue(maxsize=queue_size)
+    """
+    Threaded grabber which reads frames into a fixed ring of preallocated numpy buffers.
+    Consumers get read-only views into the ring, a view stays valid till the ring wraps around (queue_size frames),
+    the view returned by last read is kept intact till next read even if the grabber has wrapped around to its slot.
+    If the consumer falls behind by more than queue_size frames, the oldest frames are dropped and counted as overruns.
+    Failed reads are retried with exponential backoff and the camera is reopened with reopen , if no frame is
+    grabbed within reconnect_timeout the grabber stops and reads raise CameraCaptureError.
+    """
+    def __init__(self, camera_index = 0, queue_size=10 , resolution = 0 , serial_num = None , capture = None , profile = None , reopen = None , reconnect_timeout = 10.0):
+
+        super().__init__(daemon = True)
+        self.logger = logging.getLogger()
         self.cam_index = camera_index
         self.serial_number = serial_num
         self.cur_res = resolution
         self.running = True
-        
+
         # resolution of camera #
         self.cam_res_dict = {
             0 : (640,480),
@@ -20,33 +82,382 @@ class CameraCapture(threading.Thread):
             3 : (1280,960),
             4 : (1920,1080)
         }
-        
-        self.capture = cv2.VideoCapture(self.cam_index)
-        
+
         if self.cur_res == None:
             self.cur_res = 1
-        
+
         # Set the widht and height of image
         self.img_w,self.img_h = self.cam_res_dict[self.cur_res]
-        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH,self.img_w)
-        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT,self.img_h)
-    
+
+        # use the already opened and configured handle if provided (from CameraPool), else open the camera
+        self.own_capture = capture is None
+        if self.own_capture and profile is not None:
+            # open with backend , pixel format and fps of the camera model
+            self.capture = profile.open(self.cam_index,self.serial_number)
+            profile.verify(self.capture,self.serial_number)
+        elif self.own_capture:
+            self.capture = cv2.VideoCapture(self.cam_index)
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH,self.img_w)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT,self.img_h)
+        else:
+            self.capture = capture
+
+        # size the ring with what the driver has granted
+        self.img_w = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)) or self.img_w
+        self.img_h = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)) or self.img_h
+
+        ###### ring of preallocated frame buffers ######
+        self.ring_size = queue_size
+        self.frame_buffers = [numpy.empty((self.img_h,self.img_w,3),dtype = numpy.uint8) for _ in range(self.ring_size)]
+        # buffer swapped into the slot of frame still in use by consumer
+        self.spare_buffer = numpy.empty((self.img_h,self.img_w,3),dtype = numpy.uint8)
+        # sequence number of frame held in each slot of ring, -1 when the slot is empty or being written
+        self.frame_seq = [-1] * self.ring_size
+        # monotonic receive time of frame held in each slot of ring
+        self.frame_timestamps = [0.0] * self.ring_size
+        # sequence number of next frame to be written by grabber
+        self.write_seq = 0
+        # sequence number of next frame to be handed to consumer
+        self.read_seq = 0
+        # sequence number of frame returned by last read, -1 once its buffer is swapped out of the ring
+        self.held_seq = -1
+        # number of frames dropped because consumer did not keep up
+        self.overrun_count = 0
+        # monotonic receive time of frame returned by last read
+        self.read_timestamp = None
+        self.frame_ready = threading.Condition()
+        ################################################
+
+        # lock to change capture properties while grabber is reading
+        self.capture_lock = threading.Lock()
+        # flag to indicate frames are compressed payload from camera (CAP_PROP_CONVERT_RGB off)
+        self.passthrough = False
+
+        # timing of every frame grabbed
+        self.telemetry = CaptureTelemetry()
+
+        ###### recovery of failing camera ######
+        self.profile = profile
+        # function returning newly opened handle of camera , None if camera could not be opened
+        self.reopen = reopen if reopen is not None else self.reopen_own_capture
+        self.backoff = CaptureBackoff(timeout = reconnect_timeout)
+        # CameraCaptureError once the camera is given up
+        self.error = None
+        ########################################
+
+    def reopen_own_capture(self):
+        """
+        open the camera at same device node again, used when the handle is not from CameraPool.
+        """
+        self.capture.release()
+        if self.profile is not None:
+            return self.profile.open(self.cam_index,self.serial_number)
+        capture = cv2.VideoCapture(self.cam_index)
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH,self.img_w)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT,self.img_h)
+        return capture
+
+    def recover(self):
+        """
+        back off after a failed read and reopen the camera from second retry on.
+        gives up and stops the grabber if no frame is grabbed within reconnect timeout.
+        """
+        if self.backoff.is_expired():
+            self.error = CameraCaptureError(self.serial_number,self.cam_index,f"no frame for {self.backoff.timeout} s",self.telemetry.read_failure_count)
+            self.logger.error(str(self.error))
+            with self.frame_ready:
+                self.running = False
+                self.frame_ready.notify_all()
+            return
+
+        if self.backoff.failure_start is None:
+            self.logger.warning(f"Failed to grab frame , {self.serial_number} , {self.cam_index} , retrying")
+
+        if self.backoff.wait() < 2 or not self.running:
+            return
+
+        with self.capture_lock:
+            capture = self.reopen()
+            if capture is None or not capture.isOpened():
+                return
+            self.capture = capture
+            if self.passthrough:
+                self.capture.set(cv2.CAP_PROP_CONVERT_RGB,0)
+        self.logger.info(f"Reopened camera {self.serial_number} after {self.backoff.retry_count} retries")
+
     def run(self):
         while self.running:
-            ret, frame = self.capture.read()
+            with self.frame_ready:
+                slot = self.write_seq % self.ring_size
+                # slot still holds a frame that is not consumed, drop the oldest frame
+                if self.read_seq <= self.write_seq - self.ring_size:
+                    self.overrun_count += self.write_seq - self.ring_size - self.read_seq + 1
+                    self.read_seq = self.write_seq - self.ring_size + 1
+                # frame returned by last read is still in use by consumer, grab into the spare buffer instead
+                if self.held_seq >= 0 and self.held_seq % self.ring_size == slot:
+                    self.frame_buffers[slot] , self.spare_buffer = self.spare_buffer , self.frame_buffers[slot]
+                    self.held_seq = -1
+                self.frame_seq[slot] = -1
+
+            with self.capture_lock:
+                ret, frame = self.capture.read(image = self.frame_buffers[slot])
+                receive_timestamp = time.monotonic()
+                driver_timestamp = self.capture.get(cv2.CAP_PROP_POS_MSEC)
             if ret:
-                if self.queue.full():
-                    self.queue.get()  # Remove the oldest frame if the queue is full
-                self.queue.put(frame)
+                self.backoff.reset()
+                self.telemetry.record_frame(driver_timestamp,receive_timestamp)
+                # driver delivered a different size or type, keep the new buffer for this slot
+                if frame is not self.frame_buffers[slot]:
+                    self.frame_buffers[slot] = frame
+                with self.frame_ready:
+                    self.frame_seq[slot] = self.write_seq
+                    self.frame_timestamps[slot] = receive_timestamp
+                    self.write_seq += 1
+                    self.frame_ready.notify_all()
             else:
+                self.telemetry.record_failure()
                 if self.running:
-                    print(f"Failed to grab frame , {self.serial_number} , {self.cam_index}")
-    
+                    self.recover()
+
+    def refresh_telemetry(self):
+        """
+        telemetry is updated by grabber for every frame, nothing to add.
+        """
+        pass
+
+    def set_passthrough(self,enabled):
+        """
+        deliver the compressed payload from camera without decoding it to BGR.
+        returns True if the backend has accepted it, frames are 1-D jpeg buffers (MJPG) or packed yuyv frames (YUYV) in this mode.
+        """
+        with self.capture_lock:
+            self.capture.set(cv2.CAP_PROP_CONVERT_RGB,0 if enabled else 1)
+            self.passthrough = enabled and not bool(self.capture.get(cv2.CAP_PROP_CONVERT_RGB))
+        return self.passthrough
+
+    def get_view(self,seq):
+        """
+        read-only view of the frame with given sequence number, None if the slot is overwritten.
+        """
+        slot = seq % self.ring_size
+        if self.frame_seq[slot] != seq:
+            return None
+        view = self.frame_buffers[slot].view()
+        view.flags.writeable = False
+        return view
+
+    def read_frame(self,timeout = None):
+        """
+        blocking read of next frame in order, returns (ret, frame view) similar to cv2.VideoCapture.read.
+        raises CameraCaptureError once the camera is given up and all the frames grabbed before are read.
+        """
+        with self.frame_ready:
+            if not self.frame_ready.wait_for(lambda : self.read_seq < self.write_seq or not self.running,timeout = timeout):
+                return False , None
+            if self.read_seq >= self.write_seq and self.error is not None:
+                raise self.error
+            if self.read_seq >= self.write_seq:
+                return False , None
+            frame = self.get_view(self.read_seq)
+            self.read_timestamp = self.frame_timestamps[self.read_seq % self.ring_size]
+            self.held_seq = self.read_seq
+            self.read_seq += 1
+        return frame is not None , frame
+
     def get_frame(self):
-        if not self.queue.empty():
-            return self.queue.get()
-        return None
-    
+        """
+        non blocking read of next frame in order, None if no new frame is available.
+        """
+        with self.frame_ready:
+            if self.read_seq >= self.write_seq:
+                return None
+            frame = self.get_view(self.read_seq)
+            self.read_timestamp = self.frame_timestamps[self.read_seq % self.ring_size]
+            self.held_seq = self.read_seq
+            self.read_seq += 1
+        return frame
+
+    def get_latest_frame(self):
+        """
+        read-only view of most recent frame, None if no frame is grabbed yet.
+        """
+        with self.frame_ready:
+            if self.write_seq == 0:
+                return None
+            self.held_seq = self.write_seq - 1
+            return self.get_view(self.held_seq)
+
+    def skip_to_latest(self):
+        """
+        discard the frames which are not consumed yet, next read returns only the frames grabbed after this call.
+        """
+        with self.frame_ready:
+            self.read_seq = self.write_seq
+            self.overrun_count = 0
+
+    def rewind(self,since_timestamp = 0.0,max_frames = None):
+        """
+        make the frames still held in ring (pre-roll) readable again, oldest first.
+        only the frames received after since_timestamp (monotonic) are returned by next reads.
+        max_frames : max number of frames rewound , to keep slots free between grabber and the frame being recorded.
+        telemetry is trimmed to the frames rewound. returns the number of frames rewound.
+        """
+        with self.frame_ready:
+            seq = max(0,self.write_seq - min(self.ring_size,max_frames or self.ring_size))
+            while seq < self.write_seq:
+                slot = seq % self.ring_size
+                if self.frame_seq[slot] == seq and self.frame_timestamps[slot] >= since_timestamp:
+                    break
+                seq += 1
+            self.read_seq = seq
+            self.overrun_count = 0
+            # telemetry covers only the frames recorded from now on
+            self.telemetry.trim(self.frame_timestamps[seq % self.ring_size] if seq < self.write_seq else time.monotonic())
+            return self.write_seq - self.read_seq
+
     def stop(self):
         self.running = False
-        self.capture.release()
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        if self.is_alive():
+            self.join()
+        # handle from CameraPool is released by the pool
+        if self.own_capture:
+            self.capture.release()
+
+class SyncCameraCapture(threading.Thread):
+    """
+    Synchronized grabber for multiple cameras, grab() is called on every camera back-to-back
+    and only then retrieve() is called on each, so the frames of a FrameSet are aligned in time.
+    FrameSets are kept in a ring of preallocated buffers same as CameraCapture.
+    Failed grabs are retried with exponential backoff, reads raise CameraCaptureError if no FrameSet is grabbed within reconnect_timeout.
+    """
+    def __init__(self, captures , queue_size = 10 , reconnect_timeout = 10.0):
+
+        super().__init__(daemon = True)
+        self.logger = logging.getLogger()
+        # cam name -> opened cv2.VideoCapture
+        self.captures = captures
+        self.running = True
+
+        ###### ring of frame buffers for each camera ######
+        self.ring_size = queue_size
+        # buffers are allocated by retrieve on first use and reused after that
+        self.frame_buffers = [{cam_name : None for cam_name in self.captures.keys()} for _ in range(self.ring_size)]
+        self.frame_sets = [None] * self.ring_size
+        # buffers swapped into the slot of FrameSet still in use by consumer
+        self.spare_buffers = {cam_name : None for cam_name in self.captures.keys()}
+        self.write_seq = 0
+        self.read_seq = 0
+        # sequence number of FrameSet returned by last read, -1 once its buffers are swapped out of the ring
+        self.held_seq = -1
+        self.overrun_count = 0
+        self.frame_set_ready = threading.Condition()
+        ###################################################
+
+        # timing of every frame grabbed for each camera
+        self.telemetry = {cam_name : CaptureTelemetry() for cam_name in self.captures.keys()}
+
+        self.backoff = CaptureBackoff(timeout = reconnect_timeout)
+        # CameraCaptureError once the cameras are given up
+        self.error = None
+
+    def recover(self,failed_cams):
+        """
+        back off after a failed grab, gives up and stops the grabber if no FrameSet is grabbed within reconnect timeout.
+        """
+        if self.backoff.is_expired():
+            self.error = CameraCaptureError(",".join(failed_cams),None,f"no synchronized frames for {self.backoff.timeout} s",
+                                            sum(self.telemetry[cam_name].read_failure_count for cam_name in failed_cams))
+            self.logger.error(str(self.error))
+            with self.frame_set_ready:
+                self.running = False
+                self.frame_set_ready.notify_all()
+            return
+
+        if self.backoff.failure_start is None:
+            self.logger.warning(f"Failed to grab frame from {','.join(failed_cams)} , retrying")
+        self.backoff.wait()
+
+    def run(self):
+        while self.running:
+            with self.frame_set_ready:
+                slot = self.write_seq % self.ring_size
+                if self.read_seq <= self.write_seq - self.ring_size:
+                    self.overrun_count += self.write_seq - self.ring_size - self.read_seq + 1
+                    self.read_seq = self.write_seq - self.ring_size + 1
+                # FrameSet returned by last read is still in use by consumer, retrieve into the spare buffers instead
+                if self.held_seq >= 0 and self.held_seq % self.ring_size == slot:
+                    self.frame_buffers[slot] , self.spare_buffers = self.spare_buffers , self.frame_buffers[slot]
+                    self.held_seq = -1
+                self.frame_sets[slot] = None
+
+            # grab on all the cameras back-to-back
+            grab_timestamps = dict()
+            failed_cams = []
+            for cam_name , capture in self.captures.items():
+                if capture.grab():
+                    grab_timestamps[cam_name] = time.monotonic()
+                else:
+                    self.telemetry[cam_name].record_failure()
+                    failed_cams.append(cam_name)
+            if len(failed_cams):
+                self.recover(failed_cams)
+                continue
+
+            # decode the grabbed frames
+            frames = dict()
+            for cam_name , capture in self.captures.items():
+                ret , frame = capture.retrieve(image = self.frame_buffers[slot][cam_name])
+                if not ret:
+                    self.telemetry[cam_name].record_failure()
+                    self.recover([cam_name])
+                    break
+                self.frame_buffers[slot][cam_name] = frame
+                self.telemetry[cam_name].record_frame(capture.get(cv2.CAP_PROP_POS_MSEC),grab_timestamps[cam_name])
+                view = frame.view()
+                view.flags.writeable = False
+                frames[cam_name] = view
+            if len(frames) != len(self.captures):
+                continue
+
+            self.backoff.reset()
+            grab_spread_ms = (max(grab_timestamps.values()) - min(grab_timestamps.values())) * 1000
+
+            with self.frame_set_ready:
+                self.frame_sets[slot] = FrameSet(self.write_seq,frames,grab_timestamps,round(grab_spread_ms,3))
+                self.write_seq += 1
+                self.frame_set_ready.notify_all()
+
+    def read_frame_set(self,timeout = None):
+        """
+        blocking read of next FrameSet in order, returns (ret , FrameSet).
+        """
+        with self.frame_set_ready:
+            if not self.frame_set_ready.wait_for(lambda : self.read_seq < self.write_seq or not self.running,timeout = timeout):
+                return False , None
+            if self.read_seq >= self.write_seq and self.error is not None:
+                raise self.error
+            if self.read_seq >= self.write_seq:
+                return False , None
+            frame_set = self.frame_sets[self.read_seq % self.ring_size]
+            if frame_set is not None and frame_set.seq != self.read_seq:
+                frame_set = None
+            self.held_seq = self.read_seq
+            self.read_seq += 1
+        return frame_set is not None , frame_set
+
+    def skip_to_latest(self):
+        """
+        discard the FrameSets which are not consumed yet.
+        """
+        with self.frame_set_ready:
+            self.read_seq = self.write_seq
+            self.overrun_count = 0
+
+    def stop(self):
+        self.running = False
+        with self.frame_set_ready:
+            self.frame_set_ready.notify_all()
+        if self.is_alive():
+            self.join()
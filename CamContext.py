@@ -3,9 +3,11 @@ import os
 from collections import defaultdict
 
 class SeeCam:
-    def __init__(self,ser_num,cam_index):
+    def __init__(self,ser_num,cam_index,usb_path = None):
         self.serial_number = ser_num
         self.camera_index = cam_index
+        # physical usb port (udev ID_PATH) the camera is connected to
+        self.usb_path = usb_path
 
 class CamContext:
     
@@ -27,14 +29,25 @@ class CamContext:
             if device.get("ID_MODEL","Unknown") == self.cam_model:
                device_node = device.device_node
                serial_number = device.get("ID_SERIAL_SHORT","Unknown")
+               usb_path = device.get("ID_PATH","Unknown")
                
                # Append the device node to the list for the corresponding serial number
-               seecam_video_devices[serial_number].append(device_node)
+               seecam_video_devices[serial_number].append((device_node,usb_path))
                
         seecam_video_devices = {serial_num:dev[0] for serial_num , dev in dict(seecam_video_devices).items()}
         
         if len(seecam_video_devices) != 0:
             # construct seecam object for easy accesing of serial number and camera index using this object
-            return [SeeCam(key,val) for key,val in seecam_video_devices.items()]
+            return [SeeCam(key,device_node,usb_path) for key,(device_node,usb_path) in seecam_video_devices.items()]
         else:
-            return None
\ No newline at end of file
+            return None
+        
+    def get_device_node(self,serial_number):
+        """
+        function to get the current /dev/video of seecam with given serial number, None if the camera is not connected.
+        device node can change when the camera is reconnected.
+        """
+        for cam in self.get_seecam() or []:
+            if cam.serial_number == serial_number:
+                return cam.camera_index
+        return None
@@ -0,0 +1,81 @@
+import os
+import json
+import fcntl
+import cv2
+
+# values of CAP_PROP_AUTO_EXPOSURE with v4l2 backend (V4L2_CID_EXPOSURE_AUTO)
+V4L2_EXPOSURE_MANUAL = 1
+V4L2_EXPOSURE_APERTURE_PRIORITY = 3
+
+# controls read back once auto exposure and auto white balance have settled , and set while locked
+LockedControlProps = {
+    "exposure"       : cv2.CAP_PROP_EXPOSURE,
+    "gain"           : cv2.CAP_PROP_GAIN,
+    "wb_temperature" : cv2.CAP_PROP_WB_TEMPERATURE
+}
+
+def get_controls_path(json_path):
+    """
+    locked controls are kept next to CameraStartUpJson.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(json_path)),"CameraControls.json")
+
+def load_camera_controls(controls_path):
+    """
+    serial number -> locked controls of camera, empty if nothing is locked yet.
+    """
+    if not os.path.exists(controls_path):
+        return dict()
+    with open(controls_path,"r") as controls_file:
+        return json.load(controls_file)
+
+def save_camera_controls(controls_path,camera_controls):
+    """
+    merge the controls into file, controls of cameras not connected now are kept.
+    file is shared by the slots of calibration station , merge is done holding a lock on the file.
+    """
+    with open(controls_path + ".lock","w") as lock_file:
+        fcntl.flock(lock_file,fcntl.LOCK_EX)
+        saved_controls = load_camera_controls(controls_path)
+        saved_controls.update(camera_controls)
+        tmp_controls_path = controls_path + ".tmp"
+        with open(tmp_controls_path,"w") as controls_file:
+            json.dump(saved_controls,controls_file,indent = 4)
+        os.replace(tmp_controls_path,controls_path)
+
+def read_camera_controls(cap):
+    return {control : cap.get(prop) for control , prop in LockedControlProps.items()}
+
+def apply_camera_controls(cap,controls):
+    """
+    switch off auto exposure and auto white balance and set the locked values,
+    auto modes have to be off before driver accepts the manual values.
+    """
+    cap.set(cv2.CAP_PROP_AUTO_EXPOSURE,V4L2_EXPOSURE_MANUAL)
+    cap.set(cv2.CAP_PROP_AUTO_WB,0)
+    for control , prop in LockedControlProps.items():
+        if controls.get(control) is not None:
+            cap.set(prop,controls[control])
+
+def converge_camera_controls(cap,max_frames = 60,settle_frames = 5):
+    """
+    run the camera in auto exposure and auto white balance till the controls read back have not changed for settle_frames frames
+    (or max_frames are read), then lock the camera at the settled values.
+    returns the locked controls along with number of frames it took to settle.
+    """
+    cap.set(cv2.CAP_PROP_AUTO_EXPOSURE,V4L2_EXPOSURE_APERTURE_PRIORITY)
+    cap.set(cv2.CAP_PROP_AUTO_WB,1)
+
+    controls = read_camera_controls(cap)
+    stable_frame_count = 0
+    frame_count = 0
+    while frame_count < max_frames and stable_frame_count < settle_frames:
+        cap.grab()
+        frame_count += 1
+        curr_controls = read_camera_controls(cap)
+        stable_frame_count = stable_frame_count + 1 if curr_controls == controls else 0
+        controls = curr_controls
+
+    apply_camera_controls(cap,controls)
+    controls["converge_frames"] = frame_count
+    return controls
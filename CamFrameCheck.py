@@ -0,0 +1,155 @@
+import cv2
+import numpy
+import zlib
+
+class FrameSanityCheck:
+    """
+    Detects the end of camera warm-up , green/blank frames seecam gives at start up and frames with changing exposure.
+    Checks are done with per channel mean and variance on a strided subsample of frame.
+    """
+
+    def __init__(self,sample_stride = 8,min_channel_std = 2.0,min_channel_mean = 5.0,green_ratio = 2.0,max_mean_change = 4.0,stable_frame_count = 2):
+
+        # every sample_stride'th pixel in both direction is used for the checks
+        self.sample_stride = sample_stride
+        # frame with std below this in all channels has no detail (blank / green frame)
+        self.min_channel_std = min_channel_std
+        # frame with mean below this in all channels is dark
+        self.min_channel_mean = min_channel_mean
+        # frame where green mean is this many times higher than red and blue is the start up green frame
+        self.green_ratio = green_ratio
+        # max change of channel mean between consecutive frames to consider exposure as stable
+        self.max_mean_change = max_mean_change
+        # number of consecutive stable frames needed to consider warm up is done
+        self.stable_frame_count = stable_frame_count
+
+        self.reset()
+
+    def reset(self):
+        self.prev_channel_mean = None
+        self.stable_count = 0
+
+    def get_sample(self,frame):
+        """
+        strided subsample of frame as (n_pixels , 3) float array, jpeg payloads are decoded at reduced size.
+        """
+        if frame.ndim != 3:
+            frame = cv2.imdecode(frame,cv2.IMREAD_REDUCED_COLOR_8)
+            return frame.reshape(-1,3).astype(numpy.float32)
+
+        return frame[::self.sample_stride,::self.sample_stride].reshape(-1,3).astype(numpy.float32)
+
+    def get_channel_stats(self,frame):
+        """
+        returns per channel (mean , std) of frame in BGR order.
+        """
+        sample = self.get_sample(frame)
+        return sample.mean(axis = 0) , sample.std(axis = 0)
+
+    def is_frame_valid(self,channel_mean,channel_std):
+        """
+        check if the frame is not blank, dark or the green start up frame.
+        """
+        blue , green , red = channel_mean
+
+        if channel_std.max() < self.min_channel_std:
+            return False
+        if channel_mean.max() < self.min_channel_mean:
+            return False
+        if green > self.green_ratio * max(blue,red,1.0):
+            return False
+        return True
+
+    def update(self,frame):
+        """
+        check next frame from camera, returns True once the frames are valid and exposure is stable.
+        """
+        channel_mean , channel_std = self.get_channel_stats(frame)
+
+        if not self.is_frame_valid(channel_mean,channel_std):
+            self.reset()
+            return False
+
+        if self.prev_channel_mean is not None and numpy.abs(channel_mean - self.prev_channel_mean).max() <= self.max_mean_change:
+            self.stable_count += 1
+        else:
+            self.stable_count = 0
+        self.prev_channel_mean = channel_mean
+
+        return self.stable_count >= self.stable_frame_count
+
+class FrameQualityGate:
+    """
+    Rejects the frames which should not be used for calibration, checked on downscaled grey image of frame.
+    blur : variance of laplacian below min_sharpness (vibration)
+    exposure : more than max_clip_fraction of pixels clipped to black or white
+    frozen : frame identical to previous frame (driver repeating same buffer)
+    """
+
+    def __init__(self,downscale = 4,min_sharpness = 10.0,clip_low = 5,clip_high = 250,max_clip_fraction = 0.25):
+
+        self.downscale = downscale
+        self.min_sharpness = min_sharpness
+        self.clip_low = clip_low
+        self.clip_high = clip_high
+        self.max_clip_fraction = max_clip_fraction
+
+        # hash of previous frame to detect frozen frames
+        self.prev_frame_hash = None
+
+        # number of frames checked and rejected for each reason
+        # dropped : accepted frames not recorded since the FrameSet is rejected for another camera
+        self.stats = {
+            "checked"  : 0,
+            "accepted" : 0,
+            "blur"     : 0,
+            "exposure" : 0,
+            "frozen"   : 0,
+            "dropped"  : 0
+        }
+
+    def get_grey(self,frame):
+        """
+        downscaled grey image of frame, jpeg payloads are decoded at reduced size.
+        """
+        if frame.ndim != 3:
+            return cv2.imdecode(frame,cv2.IMREAD_REDUCED_GRAYSCALE_4)
+
+        small = numpy.ascontiguousarray(frame[::self.downscale,::self.downscale])
+        return cv2.cvtColor(small,cv2.COLOR_BGR2GRAY)
+
+    def check(self,frame):
+        """
+        check the frame , returns (accepted , reason) where reason is None for accepted frames.
+        """
+        self.stats["checked"] += 1
+
+        grey = self.get_grey(frame)
+
+        # frozen frame, a live camera never gives bit identical frames due to sensor noise
+        frame_hash = zlib.crc32(grey)
+        is_frozen = frame_hash == self.prev_frame_hash
+        self.prev_frame_hash = frame_hash
+
+        if is_frozen:
+            reason = "frozen"
+        elif cv2.Laplacian(grey,cv2.CV_16S).var() < self.min_sharpness:
+            reason = "blur"
+        elif numpy.count_nonzero((grey <= self.clip_low) | (grey >= self.clip_high)) > self.max_clip_fraction * grey.size:
+            reason = "exposure"
+        else:
+            reason = None
+
+        if reason is None:
+            self.stats["accepted"] += 1
+            return True , None
+
+        self.stats[reason] += 1
+        return False , reason
+
+    def drop_accepted(self):
+        """
+        count the frame accepted by last check as dropped, it is not recorded along with the rejected frames of other cameras.
+        """
+        self.stats["accepted"] -= 1
+        self.stats["dropped"] += 1
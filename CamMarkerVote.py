@@ -0,0 +1,87 @@
+import time
+from collections import deque , Counter
+from prettytable import PrettyTable
+
+class MarkerVote:
+    """
+    Maps a camera to its marker by voting over a sliding window of frames instead of trusting a single frame.
+    every frame votes for the predefined marker id it shows, frames with no predefined marker or with more than one
+    (ambiguous) do not vote. a marker id is accepted as soon as required_votes of last window_size frames agree.
+    """
+
+    def __init__(self,marker_ids,window_size = 10,required_votes = 3):
+
+        self.marker_ids = set(marker_ids)
+        self.window_size = window_size
+        self.required_votes = required_votes
+
+        # vote of last window_size frames , None for frames which did not vote
+        self.window = deque(maxlen = window_size)
+        self.frame_count = 0
+        self.ambiguous_frame_count = 0
+        # marker id accepted for the camera , None till the votes agree
+        self.marker_id = None
+        self.start_time = time.monotonic()
+        self.decision_time = None
+
+    def get_vote(self,ids):
+        """
+        predefined marker id shown in frame, None if there is no predefined marker or more than one.
+        """
+        if ids is None:
+            return None
+        frame_marker_ids = set(int(marker_id) for marker_id in ids.flatten()) & self.marker_ids
+        if len(frame_marker_ids) > 1:
+            self.ambiguous_frame_count += 1
+            return None
+        return frame_marker_ids.pop() if len(frame_marker_ids) else None
+
+    def add(self,ids):
+        """
+        add the ids detected in next frame, returns the accepted marker id once the votes agree.
+        """
+        if self.marker_id is not None:
+            return self.marker_id
+
+        self.frame_count += 1
+        self.window.append(self.get_vote(ids))
+
+        votes = self.get_votes()
+        if len(votes):
+            marker_id , vote_count = votes.most_common(1)[0]
+            if vote_count >= self.required_votes:
+                self.marker_id = marker_id
+                self.decision_time = time.monotonic()
+        return self.marker_id
+
+    def get_votes(self):
+        return Counter(vote for vote in self.window if vote is not None)
+
+    def get_report(self):
+        """
+        summary of votes , confidence is the share of frames in window which voted for the accepted (or leading) marker.
+        """
+        votes = self.get_votes()
+        marker_id , vote_count = votes.most_common(1)[0] if len(votes) else (None,0)
+        return {
+            "marker_id"       : self.marker_id,
+            "leading_id"      : marker_id,
+            "votes"           : vote_count,
+            "window"          : len(self.window),
+            "confidence"      : round(vote_count / max(1,len(self.window)),2),
+            "frames"          : self.frame_count,
+            "ambiguous"       : self.ambiguous_frame_count,
+            "time"            : round((self.decision_time or time.monotonic()) - self.start_time,2)
+        }
+
+def get_mapping_report_table(marker_votes):
+    """
+    confidence report of camera id mapping , marker_votes : serial number -> MarkerVote.
+    """
+    report_table = PrettyTable()
+    report_table.field_names = ["Camera","Marker Id","Votes","Confidence","Frames","Ambiguous Frames","Time [s]"]
+    for serial_number , marker_vote in marker_votes.items():
+        report = marker_vote.get_report()
+        marker_id = report["marker_id"] if report["marker_id"] is not None else f"not mapped (leading {report['leading_id']})"
+        report_table.add_row([serial_number,marker_id,f"{report['votes']}/{report['window']}",report["confidence"],report["frames"],report["ambiguous"],report["time"]])
+    return report_table
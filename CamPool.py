@@ -0,0 +1,221 @@
+import threading
+import logging
+import time
+
+from CamControls import converge_camera_controls
+
+class CameraPool:
+    """
+    Opens and configures every seecam once and hands out the same cv2.VideoCapture handle
+    to camera id mapping, recording and any later stage. Handles are keyed by serial number.
+    Opening and first frame of each camera are watched with a deadline, a wedged device is given up
+    and listed in failed_cams instead of blocking the run.
+    with locked controls in profile, cameras without locked values are converged in auto exposure once and locked.
+    """
+
+    def __init__(self,see_cams,profile,open_timeout = 10.0,first_frame_timeout = 5.0,converge_timeout = 10.0,max_converge_frames = 60):
+
+        self.logger = logging.getLogger()
+
+        self.see_cams = see_cams
+        # CaptureProfile used to open and configure the cameras
+        self.profile = profile
+
+        # serial number -> opened cv2.VideoCapture
+        self.captures = dict()
+        # device node -> serial number, to get the handle with camera index as well
+        self.serial_by_index = {cam.camera_index : cam.serial_number for cam in self.see_cams}
+        # serial number -> current device node , changes if camera is reconnected
+        self.device_by_serial = {cam.serial_number : cam.camera_index for cam in self.see_cams}
+        # serial number -> capture params granted by driver
+        self.granted_params = dict()
+
+        ###### watchdog of open and first frame ######
+        self.open_timeout = open_timeout
+        self.first_frame_timeout = first_frame_timeout
+        self.converge_timeout = converge_timeout
+        # serial number -> (stage , monotonic start time of stage) of cameras being opened
+        self.open_stages = dict()
+        # serial number -> reason , cameras given up while opening
+        self.failed_cams = dict()
+        ##############################################
+
+        # max frames read while auto exposure and white balance settle
+        self.max_converge_frames = max_converge_frames
+        # serial number -> controls locked in this run , to be saved for the next runs
+        self.converged_controls = dict()
+
+        self.lock = threading.Lock()
+
+    def set_open_stage(self,serial_number,stage):
+        """
+        move camera to next stage of opening, returns False if the camera is already given up by watchdog.
+        """
+        with self.lock:
+            if serial_number in self.failed_cams:
+                return False
+            if stage is None:
+                self.open_stages.pop(serial_number,None)
+            else:
+                self.open_stages[serial_number] = (stage,time.monotonic())
+            return True
+
+    def open_camera(self,cam):
+        """
+        open , configure and read first frame of single camera, run in parallel for all the cameras by open().
+        """
+        self.set_open_stage(cam.serial_number,"open")
+        cap = self.profile.open(cam.camera_index,cam.serial_number)
+
+        if not cap.isOpened():
+            with self.lock:
+                self.failed_cams[cam.serial_number] = "failed to open"
+                self.open_stages.pop(cam.serial_number,None)
+            self.logger.error(f"!!! Failed to open camera {cam.serial_number} at {cam.camera_index} !!!")
+            return
+
+        granted_params = self.profile.verify(cap,cam.serial_number)
+
+        # probe the first frame , a wedged uvc device opens fine but never delivers a frame
+        if not self.set_open_stage(cam.serial_number,"first frame"):
+            cap.release()
+            return
+        ret , _ = cap.read()
+
+        with self.lock:
+            # watchdog has given up the camera while it was blocked, handle is not used
+            if cam.serial_number in self.failed_cams:
+                cap.release()
+                return
+            if not ret:
+                self.open_stages.pop(cam.serial_number,None)
+                self.failed_cams[cam.serial_number] = "no first frame"
+                cap.release()
+                self.logger.error(f"!!! No frame from camera {cam.serial_number} at {cam.camera_index} !!!")
+                return
+
+        # camera is locked in this run if controls are to be locked and there are no locked values of it yet
+        controls = None
+        if self.profile.locked_controls is not None and self.profile.get_locked_controls(cam.serial_number) is None:
+            if not self.set_open_stage(cam.serial_number,"converge"):
+                cap.release()
+                return
+            controls = converge_camera_controls(cap,max_frames = self.max_converge_frames)
+            self.logger.info(f"{cam.serial_number} : exposure {controls['exposure']} , gain {controls['gain']} , white balance {controls['wb_temperature']} locked after {controls['converge_frames']} frames")
+
+        with self.lock:
+            if cam.serial_number in self.failed_cams:
+                cap.release()
+                return
+            self.open_stages.pop(cam.serial_number,None)
+            if controls is not None:
+                self.profile.locked_controls[cam.serial_number] = controls
+                self.converged_controls[cam.serial_number] = controls
+            self.captures[cam.serial_number] = cap
+            self.granted_params[cam.serial_number] = granted_params
+
+    def check_open_deadlines(self):
+        """
+        give up the cameras which have spent more than their budget in current stage.
+        returns the number of cameras still being opened.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for serial_number , (stage , stage_start) in list(self.open_stages.items()):
+                timeout = {"open" : self.open_timeout,"first frame" : self.first_frame_timeout,"converge" : self.converge_timeout}[stage]
+                if now - stage_start > timeout:
+                    self.failed_cams[serial_number] = f"{stage} timed out after {timeout} s"
+                    self.open_stages.pop(serial_number)
+                    self.logger.error(f"!!! Camera {serial_number} at {self.get_device(serial_number)} : {stage} timed out after {timeout} s !!!")
+            return len(self.open_stages)
+
+    def open(self):
+        """
+        open all the cameras in parallel, since opening and negotiating format of v4l2 device is slow.
+        returns once every camera is opened or given up, workers blocked on a wedged device are left behind as daemon threads.
+        """
+        cams_to_open = [cam for cam in self.see_cams if cam.serial_number not in self.captures]
+        for cam in cams_to_open:
+            self.failed_cams.pop(cam.serial_number,None)
+            self.set_open_stage(cam.serial_number,"open")
+
+        open_workers = [threading.Thread(target = self.open_camera,args = (cam,),daemon = True) for cam in cams_to_open]
+
+        for worker in open_workers:
+            worker.start()
+        while self.check_open_deadlines() > 0:
+            time.sleep(0.05)
+
+        return self
+
+    def get_serial(self,cam_key):
+        """
+        get the serial number of camera with serial number or device node.
+        """
+        if cam_key in self.serial_by_index:
+            return self.serial_by_index[cam_key]
+        return cam_key
+
+    def get_capture(self,cam_key):
+        """
+        get the opened handle for a camera, cam_key can either be the serial number or the device node.
+        """
+        return self.captures.get(self.get_serial(cam_key))
+
+    def get_device(self,cam_key):
+        """
+        get the device node of camera with serial number or device node.
+        """
+        return self.device_by_serial.get(self.get_serial(cam_key),cam_key)
+
+    def release_capture(self,cam_key):
+        """
+        release the handle of single camera, so the device can be opened by another process.
+        open() opens it again.
+        """
+        with self.lock:
+            cap = self.captures.pop(self.get_serial(cam_key),None)
+            if cap is not None:
+                cap.release()
+
+    def reopen_capture(self,cam_key,resolve_device = None):
+        """
+        release the handle of camera and open it again with the same profile, used to recover a camera after usb disconnect.
+        resolve_device : function to get the current device node of serial number, None if camera is not connected.
+        returns the new handle, None if the camera could not be opened.
+        """
+        serial_number = self.get_serial(cam_key)
+        self.release_capture(serial_number)
+
+        device = resolve_device(serial_number) if resolve_device is not None else self.get_device(serial_number)
+        if device is None:
+            return None
+
+        cap = self.profile.open(device,serial_number)
+        if not cap.isOpened():
+            return None
+        granted_params = self.profile.verify(cap,serial_number)
+
+        with self.lock:
+            self.captures[serial_number] = cap
+            self.granted_params[serial_number] = granted_params
+            # old device node is kept , camera is still looked up with the node it was mapped with
+            self.serial_by_index[device] = serial_number
+            self.device_by_serial[serial_number] = device
+
+        return cap
+
+    def close(self):
+        """
+        release all the opened handles.
+        """
+        with self.lock:
+            for cap in self.captures.values():
+                cap.release()
+            self.captures.clear()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
@@ -0,0 +1,103 @@
+import cv2
+import logging
+
+from CamControls import apply_camera_controls
+
+# capture settings for each camera model, keyed by ID_MODEL reported by udev (CamContext.cam_model)
+# fourcc : pixel format requested from camera, MJPG keeps usb bandwidth low enough for three cameras on one bus
+# backend : capture api used to open the camera
+CameraCaptureProfiles = {
+    "See3CAM_CU20" : {
+        "fourcc"      : "MJPG",
+        "backend"     : "V4L2",
+        "fps"         : 15,
+        "buffer_size" : 1
+    },
+    "Default" : {
+        "fourcc"      : None,
+        "backend"     : "ANY",
+        "fps"         : 15,
+        "buffer_size" : 1
+    }
+}
+
+class CaptureProfile:
+    """
+    Opens the camera with the backend of camera model, requests pixel format, resolution and fps,
+    and verifies what the driver has actually granted.
+    cameras with locked controls are opened with exposure and white balance fixed at the locked values.
+    """
+
+    def __init__(self,cam_model,width,height,fourcc = None,fps = None,locked_controls = None):
+
+        self.logger = logging.getLogger()
+
+        self.cam_model = cam_model
+        profile = CameraCaptureProfiles.get(cam_model,CameraCaptureProfiles["Default"])
+
+        self.width = width
+        self.height = height
+        # params from cli takes priority over the profile
+        self.fourcc = fourcc if fourcc is not None else profile["fourcc"]
+        self.fps = fps if fps is not None else profile["fps"]
+        self.buffer_size = profile["buffer_size"]
+        self.backend = getattr(cv2,f"CAP_{profile['backend']}")
+        # serial number -> exposure , gain and white balance the camera is locked at , None to run cameras in auto mode
+        self.locked_controls = locked_controls
+
+    @staticmethod
+    def decode_fourcc(fourcc_val):
+        """
+        convert the fourcc returned by CAP_PROP_FOURCC to string.
+        """
+        fourcc_val = int(fourcc_val)
+        return "".join(chr((fourcc_val >> 8 * i) & 0xFF) for i in range(4))
+
+    def open(self,device,serial_number = None):
+        """
+        open the camera with the backend of the profile and apply the profile, along with locked controls of the serial number.
+        """
+        cap = cv2.VideoCapture(device,self.backend)
+        if cap.isOpened():
+            self.apply(cap)
+            if self.get_locked_controls(serial_number) is not None:
+                apply_camera_controls(cap,self.locked_controls[serial_number])
+        return cap
+
+    def get_locked_controls(self,serial_number):
+        if self.locked_controls is None or serial_number is None:
+            return None
+        return self.locked_controls.get(serial_number)
+
+    def apply(self,cap):
+        """
+        set the capture params, pixel format has to be set before resolution for v4l2 to negotiate the mode.
+        """
+        if self.fourcc is not None:
+            cap.set(cv2.CAP_PROP_FOURCC,cv2.VideoWriter_fourcc(*self.fourcc))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH,self.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT,self.height)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE,self.buffer_size)
+        cap.set(cv2.CAP_PROP_FPS,self.fps)
+
+    def verify(self,cap,cam_name = None):
+        """
+        read back the params granted by driver and log the mismatch with requested params.
+        returns the dict of granted params.
+        """
+        granted = {
+            "fourcc" : self.decode_fourcc(cap.get(cv2.CAP_PROP_FOURCC)),
+            "width"  : int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height" : int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps"    : cap.get(cv2.CAP_PROP_FPS)
+        }
+
+        requested = {"width" : self.width,"height" : self.height,"fps" : self.fps}
+        if self.fourcc is not None:
+            requested["fourcc"] = self.fourcc
+
+        for param , requested_val in requested.items():
+            if granted[param] != requested_val:
+                self.logger.warning(f"{cam_name} : requested {param} {requested_val} , driver granted {granted[param]}")
+
+        return granted
@@ -0,0 +1,758 @@
+import cv2
+import sys
+import threading
+import time
+import os
+import math
+import json
+import shutil
+
+from CamPool import CameraPool
+from CamProfile import CaptureProfile
+from CamCapture import CameraCapture , SyncCameraCapture , CameraCaptureError
+from CamSharedCapture import SharedCameraCapture
+from CamWriter import convert_raw_to_video , FramePacer
+from CamBenchmark import get_best_resolution , get_pixel_format
+from CamStaging import StagingFlusher
+from CamRoi import get_roi_profile_path , load_record_rois
+from CamFrameCheck import FrameSanityCheck , FrameQualityGate
+from CamControls import get_controls_path , load_camera_controls , save_camera_controls
+
+class CameraRecorder:
+    """
+    Mixin which holds the capture + write loop used while recording the calibration videos.
+    expects the child class to provide self.args, self.logger, self.w, self.h, self.cam_model, self.see_cams and get_device_node (CamContext).
+    """
+
+    # slots of capture ring kept free beyond pre-roll
+    ring_margin = 4
+
+    def __init__(self):
+
+        # pool of opened camera handles shared by camera id mapping and recording
+        self.cam_pool = None
+        # threaded ring buffer grabber running on each pooled handle, keyed by serial number
+        self.cam_captures = dict()
+
+        # number of frames written for each camera, used to print the progress of recording
+        self.recorded_frame_count = dict()
+        # number of frames skipped for each camera till warm up is done
+        self.warmup_frame_count = dict()
+        # summary of capture timing while recording each camera
+        self.capture_telemetry = dict()
+        # number of frames to be written for each camera , differs from record_frame_count with record_duration
+        self.target_frame_count = dict()
+        # pacer of each camera in paced recording
+        self.frame_pacers = dict()
+        # quality gate of each camera and the frames tagged by it
+        self.quality_gates = dict()
+        self.quality_tags = dict()
+        # monotonic time from which frames held in pre-roll ring can be recorded, None when pre-roll is not started
+        self.preroll_start_time = None
+        # flag to indicate the progress of recording all the cameras concurrently
+        self.recording_done = threading.Event()
+        # directory where videos are recorded and played back from , set with setup_staging
+        self.video_dir = None
+        # background copy of staged recordings to data dir
+        self.staging_flusher = None
+
+    def setup_staging(self,data_dir):
+        """
+        get the directory to record videos in, a directory in staging_dir (tmpfs) if enabled else data_dir itself.
+        staged files are copied to data_dir in background with flush_staged_recordings.
+        """
+        if self.args.staging_dir is None:
+            return data_dir
+
+        video_dir = os.path.join(self.args.staging_dir,os.path.basename(data_dir))
+        os.makedirs(video_dir,exist_ok = True)
+
+        # raw recordings are preallocated, check if all of them fit in staging dir
+        if self.args.record_format == "raw":
+            required_bytes = self.get_raw_recording_size()
+            free_bytes = shutil.disk_usage(video_dir).free
+            if required_bytes > free_bytes:
+                self.logger.warning(f"Raw recordings need {required_bytes // 2**20} MB , only {free_bytes // 2**20} MB free in {self.args.staging_dir} , recording to {data_dir}")
+                os.rmdir(video_dir)
+                return data_dir
+
+        self.staging_flusher = StagingFlusher(data_dir,bandwidth = self.args.staging_bandwidth * 2**20)
+        self.staging_flusher.start()
+        self.logger.info(f"Recording in {video_dir} , copied to {data_dir} in background")
+        return video_dir
+
+    def get_raw_recording_size(self):
+        """
+        bytes preallocated by raw recordings of all the cameras, frames are cropped to region of interest of each camera.
+        frame count of paced recording with record_duration is estimated at fps requested from cameras.
+        """
+        cam_names = [cam_name for cam_name , cam_index in self.cam_name_and_index.items() if cam_index is not None]
+        record_rois = self.get_record_rois(cam_names,log_rois = False)
+        record_frame_count = self.get_record_frame_count(self.cam_pool.profile.fps if self.cam_pool is not None else None)
+
+        required_bytes = 0
+        for cam_name in cam_names:
+            width , height = record_rois[cam_name].get_frame_size() if cam_name in record_rois else (self.w,self.h)
+            required_bytes += record_frame_count * width * height * 3
+        return required_bytes
+
+    def flush_staged_recordings(self):
+        """
+        queue the files in staging dir to be copied to data dir, files already queued are skipped.
+        """
+        if self.staging_flusher is None:
+            return
+        for file_name in sorted(os.listdir(self.video_dir)):
+            self.staging_flusher.copy(os.path.join(self.video_dir,file_name))
+
+    def finish_staging(self):
+        """
+        wait for the copy of staged files, staging dir is removed once every copy is verified.
+        """
+        if self.staging_flusher is None:
+            return
+
+        self.flush_staged_recordings()
+        if self.staging_flusher.finish():
+            self.logger.info(f"{len(self.staging_flusher.results)} staged files ({self.staging_flusher.copied_bytes // 2**20} MB) copied and verified")
+            shutil.rmtree(self.video_dir)
+        else:
+            self.logger.error(f"!!! Not all the staged files are copied , recordings are kept in {self.video_dir} !!!")
+        self.staging_flusher = None
+
+    def get_record_rois(self,cam_names,log_rois = True):
+        """
+        region of interest of each camera from roi profile of current BotType, empty if record_roi is not enabled.
+        log_rois : False to get the regions without logging them
+        """
+        if not self.args.record_roi:
+            return dict()
+
+        profile_path = self.args.roi_profile_path or get_roi_profile_path(self.args.json_path)
+        bot_type = self.current_json["CamParams"][0]["BotType"]
+        record_rois = load_record_rois(profile_path,bot_type,self.w,self.h,cam_names)
+        if not log_rois:
+            return record_rois
+
+        for cam_name , record_roi in record_rois.items():
+            roi = record_roi.get_metadata()
+            self.logger.info(f"{cam_name} : recording region {roi['roi_width']}x{roi['roi_height']} at ({roi['roi_x']},{roi['roi_y']}) with step {roi['step']} as {roi['width']}x{roi['height']}")
+        return record_rois
+
+    def select_benchmarked_resolution(self):
+        """
+        pick the resolution from cached benchmark of connected cameras, --resolution is kept if there is no safe mode.
+        """
+        pixel_format = get_pixel_format(self.cam_model,self.args.pixel_format)
+        best_resolution = get_best_resolution(self.args.benchmark_cache,self.see_cams,pixel_format)
+        if best_resolution is None:
+            self.logger.warning(f"No benchmark of connected cameras on current ports with pixel format {pixel_format} in {self.args.benchmark_cache} , using resolution {self.args.resolution}")
+            return
+
+        self.args.resolution = best_resolution
+        self.w , self.h = self.cam_res_dict[best_resolution]
+        self.logger.info(f"Using benchmarked resolution {best_resolution} ({self.w},{self.h})")
+
+    def open_cameras(self):
+        """
+        open and configure all the seecams once, the same handles are used till release_cameras is called.
+        """
+        if self.cam_pool is None:
+            profile = CaptureProfile(self.cam_model,self.w,self.h,fourcc = self.args.pixel_format,locked_controls = self.load_locked_controls())
+            self.cam_pool = CameraPool(self.see_cams,profile,
+                                       open_timeout = self.args.open_timeout,
+                                       first_frame_timeout = self.args.first_frame_timeout,
+                                       converge_timeout = self.args.open_timeout,
+                                       max_converge_frames = self.args.max_converge_frames)
+        self.cam_pool.open()
+        self.save_locked_controls()
+
+        # cameras which did not open or deliver first frame within the budget
+        for cam in list(self.see_cams):
+            if cam.serial_number in self.cam_pool.failed_cams:
+                self.give_up_camera(cam,self.cam_pool.failed_cams[cam.serial_number])
+
+    def load_locked_controls(self):
+        """
+        serial number -> locked exposure , gain and white balance of cameras from previous runs, None if controls are not locked.
+        """
+        if not self.args.lock_controls:
+            return None
+        if self.args.relock_controls:
+            return dict()
+
+        locked_controls = load_camera_controls(self.args.controls_path or get_controls_path(self.args.json_path))
+        for cam in self.see_cams:
+            if cam.serial_number in locked_controls:
+                self.logger.info(f"{cam.serial_number} : opening with locked exposure {locked_controls[cam.serial_number]['exposure']} , white balance {locked_controls[cam.serial_number]['wb_temperature']}")
+        return locked_controls
+
+    def save_locked_controls(self):
+        """
+        keep the controls locked in this run for the next runs.
+        """
+        if len(self.cam_pool.converged_controls) == 0:
+            return
+        save_camera_controls(self.args.controls_path or get_controls_path(self.args.json_path),self.cam_pool.converged_controls)
+        self.cam_pool.converged_controls.clear()
+
+    def give_up_camera(self,cam,reason):
+        """
+        abort the run or skip the camera which has not responded within its budget, based on on_camera_timeout.
+        only the camera is_skippable_camera allows is skipped , the run is aborted for any other camera.
+        """
+        if self.args.on_camera_timeout == "abort" or not self.is_skippable_camera(cam):
+            raise CameraCaptureError(cam.serial_number,cam.camera_index,reason)
+
+        self.logger.error(f"!!! Skipping camera {cam.serial_number} at {cam.camera_index} : {reason} !!!")
+        self.see_cams = [see_cam for see_cam in self.see_cams if see_cam.serial_number != cam.serial_number]
+        if self.cam_pool is not None:
+            self.cam_pool.see_cams = self.see_cams
+
+    def is_skippable_camera(self,cam):
+        """
+        whether the run can continue without the camera , overridden by calibration which has a path without it.
+        """
+        return False
+
+    def get_camera(self,cam_key):
+        """
+        get the opened camera handle with serial number or camera index.
+        """
+        if self.cam_pool is None:
+            self.open_cameras()
+        return self.cam_pool.get_capture(cam_key)
+
+    def get_camera_capture(self,cam_key):
+        """
+        get the running CameraCapture of camera with serial number or camera index, started on first use.
+        with capture_processes a SharedCameraCapture is started instead, which has the same read interface.
+        """
+        if self.cam_pool is None:
+            self.open_cameras()
+        serial_number = self.cam_pool.get_serial(cam_key)
+
+        if serial_number not in self.cam_captures and self.args.capture_processes:
+            # v4l2 device is streamed by single handle, capture process opens the camera again
+            self.cam_pool.release_capture(serial_number)
+            cam_capture = SharedCameraCapture(camera_index = self.cam_pool.get_device(serial_number),
+                                              queue_size = self.get_capture_ring_size(),
+                                              serial_num = serial_number,
+                                              profile = self.cam_pool.profile,
+                                              reconnect_timeout = self.args.reconnect_timeout)
+            cam_capture.start()
+            self.cam_captures[serial_number] = cam_capture
+
+        if serial_number not in self.cam_captures:
+            cam_capture = CameraCapture(camera_index = cam_key,
+                                        queue_size = self.get_capture_ring_size(),
+                                        resolution = self.args.resolution,
+                                        serial_num = serial_number,
+                                        capture = self.cam_pool.get_capture(serial_number),
+                                        reopen = lambda : self.cam_pool.reopen_capture(serial_number,self.get_device_node),
+                                        reconnect_timeout = self.args.reconnect_timeout)
+            cam_capture.start()
+            self.cam_captures[serial_number] = cam_capture
+
+        return self.cam_captures[serial_number]
+
+    def start_luma_capture(self,cap):
+        """
+        deliver the yuyv frames from camera without decoding to bgr, so markers are detected on luma plane.
+        only with YUYV pixel format and without pre-roll, since pre-roll frames are recorded.
+        returns True if the frames are yuyv.
+        """
+        if self.cam_pool.profile.fourcc != "YUYV" or self.args.preroll_seconds > 0:
+            return False
+        return cap.set_passthrough(True)
+
+    def stop_luma_capture(self,cap):
+        """
+        decode the frames to bgr again, yuyv frames still in ring are discarded.
+        """
+        cap.set_passthrough(False)
+        # every frame grabbed after the first bgr frame is bgr
+        while True:
+            ret , frame = cap.read_frame(timeout = self.args.first_frame_timeout)
+            if not ret or (frame.ndim == 3 and frame.shape[2] == 3):
+                break
+        cap.skip_to_latest()
+
+    def read_frame_batch(self,cap,batch_size,timeout = None):
+        """
+        blocking read of next frame along with the frames already waiting in ring, at most batch_size frames.
+        views are valid till the ring wraps around, so batch is kept smaller than the ring.
+        """
+        ret , frame = cap.read_frame(timeout = timeout)
+        if not ret:
+            return []
+
+        frames = [frame]
+        while len(frames) < min(batch_size,self.get_capture_ring_size() - 1):
+            frame = cap.get_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+        return frames
+
+    def get_preroll_frame_count(self):
+        return math.ceil(self.args.preroll_seconds * self.cam_pool.profile.fps)
+
+    def get_capture_ring_size(self):
+        """
+        number of frames held by each CameraCapture, enough to keep preroll_seconds of frames along with a margin.
+        async writer copies the frames into its own queue, so it needs no room in ring.
+        """
+        return max(10,self.get_preroll_frame_count() + self.ring_margin)
+
+    def start_preroll_capture(self):
+        """
+        start grabbing all the cameras in background, the last preroll_seconds of frames are kept in ring of each camera.
+        recording starts with these frames instead of waiting for new frames.
+        """
+        self.preroll_start_time = time.monotonic()
+        for cam in self.see_cams:
+            self.get_camera_capture(cam.serial_number)
+
+    def stop_camera_captures(self):
+        """
+        stop the grabbers running on pooled handles, the handles are kept open.
+        """
+        for cam_capture in self.cam_captures.values():
+            cam_capture.stop()
+        self.cam_captures.clear()
+
+    def stop_camera_capture(self,cam_key):
+        """
+        stop the grabber of single camera, the pooled handle is kept open.
+        """
+        cam_capture = self.cam_captures.pop(self.cam_pool.get_serial(cam_key),None)
+        if cam_capture is not None:
+            cam_capture.stop()
+
+    def release_cameras(self):
+        """
+        stop the grabbers and release all the camera handles opened by open_cameras.
+        """
+        self.stop_camera_captures()
+
+        if self.cam_pool is not None:
+            self.cam_pool.close()
+            self.cam_pool = None
+
+    def notify_recording_done(self):
+        """
+        create recording_done_path once the cameras are released , usb bandwidth is free for the next slot of station.
+        """
+        if self.args.recording_done_path is not None:
+            open(self.args.recording_done_path,"w").close()
+
+    def is_jpeg_granted(self,cam_key):
+        """
+        whether driver has granted MJPG to camera , else payload without decoding is raw (yuyv) and not jpeg.
+        """
+        granted_params = self.cam_pool.granted_params.get(self.cam_pool.get_serial(cam_key),{})
+        return granted_params.get("fourcc") == "MJPG"
+
+    def start_cam_recording(self,cam_name,cam_index):
+        """
+        get the grabber of camera ready for recording, returns the CameraCapture to read frames from.
+        """
+        cap = self.get_camera_capture(cam_index)
+
+        # in mjpeg record format the jpeg payload from camera is written as it is , unless the frames are cropped
+        if self.args.record_format == "mjpeg" and not self.args.record_roi and not (self.is_jpeg_granted(cam_index) and cap.set_passthrough(True)):
+            self.logger.warning(f"{cam_name} : camera does not deliver jpeg payload , frames will be encoded to jpeg while writing")
+
+        if self.preroll_start_time is not None:
+            # record the frames already held in ring since the bot is placed
+            preroll_frame_count = cap.rewind(self.preroll_start_time,max_frames = self.get_preroll_frame_count())
+            self.logger.info(f"{cam_name} : {preroll_frame_count} pre-roll frames available")
+        else:
+            # record only the frames grabbed from now on
+            cap.skip_to_latest()
+            cap.telemetry.reset()
+        return cap
+
+    def read_camera_frame(self,cap):
+        """
+        blocking read of next frame from grabber, raises CameraCaptureError if no frame is delivered within reconnect_timeout.
+        a wedged camera blocks in read without failing , so it is never given up by the backoff of grabber.
+        """
+        read_start = time.monotonic()
+        ret , frame = cap.read_frame(timeout = self.args.reconnect_timeout)
+        if not ret and time.monotonic() - read_start >= self.args.reconnect_timeout:
+            raise CameraCaptureError(cap.serial_number,cap.cam_index,f"no frame for {self.args.reconnect_timeout} s")
+        return ret , frame
+
+    def read_camera_frame_set(self,sync_capture):
+        """
+        blocking read of next FrameSet from synchronized grabber, raises CameraCaptureError if no FrameSet is delivered within reconnect_timeout.
+        """
+        read_start = time.monotonic()
+        ret , frame_set = sync_capture.read_frame_set(timeout = self.args.reconnect_timeout)
+        if not ret and time.monotonic() - read_start >= self.args.reconnect_timeout:
+            raise CameraCaptureError(",".join(sync_capture.captures.keys()),None,f"no synchronized frames for {self.args.reconnect_timeout} s")
+        return ret , frame_set
+
+    def wait_for_warmup(self,cam_name,cap):
+        """
+        skip the frames till camera gives valid frames with stable exposure, returns the number of frames skipped.
+        """
+        sanity_check = FrameSanityCheck()
+        skipped_frame_count = 0
+
+        while skipped_frame_count < self.args.max_warmup_frames:
+            ret , frame = self.read_camera_frame(cap)
+            if not ret:
+                continue
+            if sanity_check.update(frame):
+                break
+            skipped_frame_count += 1
+
+        self.warmup_frame_count[cam_name] = skipped_frame_count
+        return skipped_frame_count
+
+    def start_quality_gate(self,cam_name):
+        """
+        create the quality gate of camera, nothing is checked when quality_gate is off.
+        """
+        if self.args.quality_gate == "off":
+            return
+        self.quality_gates[cam_name] = FrameQualityGate(min_sharpness = self.args.min_sharpness)
+        self.quality_tags[cam_name] = []
+
+    def check_frame_quality(self,cam_name,frame,frame_index):
+        """
+        check the frame with quality gate of camera, returns False if the frame has to be rejected.
+        in tag mode every frame is written and the bad frames are only noted.
+        """
+        if cam_name not in self.quality_gates:
+            return True
+
+        accepted , reason = self.quality_gates[cam_name].check(frame)
+        if accepted:
+            return True
+
+        if self.args.quality_gate == "tag":
+            self.quality_tags[cam_name].append({"frame" : frame_index,"reason" : reason})
+            return True
+        return False
+
+    def get_rejected_frame_count(self,cam_name):
+        """
+        number of frames rejected by quality gate of camera , frames only tagged are not rejected.
+        """
+        if cam_name not in self.quality_gates or self.args.quality_gate != "reject":
+            return 0
+        stats = self.quality_gates[cam_name].stats
+        return stats["checked"] - stats["accepted"] - stats["dropped"]
+
+    def save_quality_report(self,cam_name,out):
+        """
+        write the rejection statistics and tagged frames of camera as sidecar next to the video.
+        """
+        if cam_name not in self.quality_gates:
+            return
+
+        quality_report = {
+            "mode"   : self.args.quality_gate,
+            "stats"  : self.quality_gates[cam_name].stats,
+            "tagged" : self.quality_tags[cam_name]
+        }
+        quality_path = os.path.join(out.video_path,os.path.splitext(self.get_video_file_name(cam_name))[0] + ".quality.json")
+        with open(quality_path,"w") as quality_file:
+            json.dump(quality_report,quality_file,indent = 4)
+
+    def measure_capture_fps(self,cam_name,telemetry,refresh_telemetry = None,min_frame_count = 6):
+        """
+        capture rate of camera from receive timestamps already in telemetry (pre-roll frames included), no frame is consumed.
+        waits for the grabber till min_frame_count frames are measured , kept below the free slots of ring so waiting does not overrun it.
+        refresh_telemetry : called before every check for grabbers whose telemetry is updated on demand.
+        falls back to fps granted by driver if camera does not deliver frames.
+        """
+        deadline = time.monotonic() + self.args.first_frame_timeout
+        while True:
+            if refresh_telemetry is not None:
+                refresh_telemetry()
+            summary = telemetry.get_summary()
+            if summary["frame_count"] >= min_frame_count or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+
+        if summary["effective_fps"]:
+            return summary["effective_fps"]
+
+        granted_fps = self.cam_pool.granted_params.get(self.cam_pool.get_serial(self.cam_name_and_index[cam_name]),{}).get("fps")
+        fps = granted_fps or self.cam_pool.profile.fps
+        self.logger.warning(f"{cam_name} : capture fps could not be measured , using {fps}")
+        return fps
+
+    def start_pacing(self,cam_names,fps,out):
+        """
+        open the writers of cameras at fps and start pacing the frames with their timestamps.
+        cameras recorded together with SyncCameraCapture share the same pacer.
+        """
+        pacer = FramePacer(fps)
+        for cam_name in cam_names:
+            out.open_writer(cam_name,fps)
+            self.frame_pacers[cam_name] = pacer
+            self.logger.info(f"{cam_name} : recording at measured capture rate of {fps} fps")
+        return pacer
+
+    def record_cam_video(self,cam_name,cam_index,out,print_progress = False):
+        """
+        capture frames from given camera and write them with the shared CameraWriter till record_frame_count is reached.
+        print_progress : True to print the progress of current camera (used while recording one camera after another)
+        """
+        cap = self.start_cam_recording(cam_name,cam_index)
+
+        # start recording as soon as frames from camera are valid and stable
+        self.wait_for_warmup(cam_name,cap)
+
+        self.start_quality_gate(cam_name)
+
+        # in paced recording the video is written at measured capture rate
+        pacer = None
+        if self.args.paced_recording:
+            pacer = self.start_pacing([cam_name],self.measure_capture_fps(cam_name,cap.telemetry,cap.refresh_telemetry),out)
+        record_frame_count = self.get_record_frame_count(pacer.fps if pacer is not None else None)
+        self.target_frame_count[cam_name] = record_frame_count
+
+        # count to keep track of frames being written from current camera
+        frame_count = 0
+
+        # keep recording till enough good frames are written
+        while frame_count < record_frame_count and self.get_rejected_frame_count(cam_name) <= self.args.max_rejected_frames:
+            ret , frame = self.read_camera_frame(cap)
+            if ret:
+                if not self.check_frame_quality(cam_name,frame,frame_count):
+                    continue
+                repeat_count = 1 if pacer is None else min(pacer.get_repeat_count(cap.read_timestamp),record_frame_count - frame_count)
+                for _ in range(repeat_count):
+                    out.write_image(cam_name,frame,cap.read_timestamp)
+                frame_count += repeat_count
+                self.recorded_frame_count[cam_name] = frame_count
+
+                #### print progress of writing frames ######
+                if print_progress:
+                    self.current_frame_count = frame_count
+                    self.log_progress(f"{self.get_formatted_timestamp()} Recording Video Of {cam_name} [{self.current_frame_count}/{record_frame_count} frames]")
+
+        self.save_capture_telemetry(cam_name,cap.telemetry,out)
+        self.save_quality_report(cam_name,out)
+
+        return cap
+
+    def save_capture_telemetry(self,cam_name,telemetry,out):
+        """
+        write capture timing of camera as sidecar next to the video.
+        """
+        telemetry_path = os.path.join(out.video_path,os.path.splitext(self.get_video_file_name(cam_name))[0] + ".telemetry.json")
+        self.capture_telemetry[cam_name] = telemetry.save(telemetry_path)
+        if cam_name in self.frame_pacers:
+            self.capture_telemetry[cam_name]["pacing"] = self.frame_pacers[cam_name].get_stats()
+
+    def log_recording_report(self,cam_name,cap):
+        """
+        log the warm up frames skipped and frames dropped by ring buffer while recording.
+        """
+        warmup_frame_count = self.warmup_frame_count.get(cam_name,0)
+        if warmup_frame_count >= self.args.max_warmup_frames:
+            self.logger.warning(f"{cam_name} : frames not stable after {warmup_frame_count} warm up frames , recording started anyway")
+        else:
+            self.logger.info(f"{cam_name} : skipped {warmup_frame_count} warm up frames")
+
+        if cap.overrun_count > 0:
+            self.logger.warning(f"{cam_name} : {cap.overrun_count} frames dropped since recording did not keep up with camera")
+
+        if cam_name in self.quality_gates:
+            stats = self.quality_gates[cam_name].stats
+            self.logger.info(f"{cam_name} : quality gate checked {stats['checked']} frames , blur {stats['blur']} , exposure {stats['exposure']} , frozen {stats['frozen']} , dropped {stats['dropped']}")
+            if self.recorded_frame_count.get(cam_name,0) < self.target_frame_count.get(cam_name,self.args.record_frame_count):
+                self.logger.warning(f"{cam_name} : only {self.recorded_frame_count.get(cam_name,0)} good frames recorded , more than {self.args.max_rejected_frames} frames rejected")
+
+        telemetry = self.capture_telemetry.get(cam_name)
+        if telemetry is not None:
+            self.logger.info(f"{cam_name} : effective fps {telemetry['effective_fps']} , max frame gap {telemetry['gap_max_ms']} ms , read failures {telemetry['read_failure_count']}")
+        if telemetry is not None and "pacing" in telemetry:
+            pacing = telemetry["pacing"]
+            self.logger.info(f"{cam_name} : written at {pacing['fps']} fps , {pacing['frames_duplicated']} frames duplicated , {pacing['frames_dropped']} frames dropped")
+
+    def convert_raw_recordings(self,video_dir):
+        """
+        convert the raw recordings to mp4 for VideoPlayback build, recordings which are already converted are skipped.
+        """
+        for cam_name in self.cam_name_and_index.keys():
+            raw_path = os.path.join(video_dir,self.get_video_file_name(cam_name))
+            video_path = os.path.join(video_dir,self.get_video_file_name(cam_name,playback = True))
+            if os.path.exists(raw_path) and not os.path.exists(video_path):
+                self.logger.info(f"Converting raw recording of {cam_name} to {os.path.basename(video_path)}")
+                convert_raw_to_video(raw_path,video_path)
+
+    def print_recording_progress(self):
+        """
+        Utility function to print the progress of all the cameras being recorded concurrently in a single line.
+        """
+        def progress_line():
+            cam_progress = " | ".join(f"{cam_name} {frame_count}/{self.target_frame_count.get(cam_name,self.args.record_frame_count)}" for cam_name,frame_count in self.recorded_frame_count.items())
+            return f"\r{self.get_formatted_timestamp()} Recording Video [{cam_progress}] frames"
+
+        while not self.recording_done.is_set():
+            sys.stdout.write(progress_line())
+            sys.stdout.flush()
+            time.sleep(0.2)
+        sys.stdout.write(progress_line())
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+    def record_videos_sequentially(self,cam_name_and_index,out):
+        """
+        record one camera after another, only the cameras still to be recorded are grabbed.
+        grabbers started for camera id mapping are stopped unless they hold pre-roll frames.
+        """
+        if self.preroll_start_time is None:
+            self.stop_camera_captures()
+
+        for cam_name , cam_index in cam_name_and_index.items():
+            cap = self.record_cam_video(cam_name,cam_index,out,print_progress = True)
+            self.log_recording_report(cam_name,cap)
+            self.stop_camera_capture(cam_index)
+
+    def record_videos_concurrently(self,cam_name_and_index,out):
+        """
+        record all the cameras at the same time, one capture + write worker per camera sharing the CameraWriter.
+        """
+        self.recording_done.clear()
+        self.recorded_frame_count = {cam_name : 0 for cam_name in cam_name_and_index.keys()}
+
+        progress_thread = threading.Thread(target = self.print_recording_progress)
+        progress_thread.start()
+
+        # cam name -> exception raised by worker of camera , re-raised once all the workers are done
+        record_errors = dict()
+
+        def record_worker(cam_name,cam_index):
+            try:
+                self.record_cam_video(cam_name,cam_index,out)
+            except Exception as error:
+                record_errors[cam_name] = error
+
+        # one worker per camera, each camera has its own writer inside CameraWriter
+        record_workers = [threading.Thread(target = record_worker,args = (cam_name,cam_index),name = f"Record{cam_name}")
+                          for cam_name , cam_index in cam_name_and_index.items()]
+
+        for worker in record_workers:
+            worker.start()
+
+        # single join point for all the cameras
+        for worker in record_workers:
+            worker.join()
+
+        self.recording_done.set()
+        progress_thread.join()
+
+        if len(record_errors):
+            for cam_name , error in record_errors.items():
+                self.logger.error(f"{cam_name} : recording failed , {error}")
+            raise next(iter(record_errors.values()))
+
+        for cam_name , cam_index in cam_name_and_index.items():
+            self.log_recording_report(cam_name,self.get_camera_capture(cam_index))
+
+    def record_videos_synchronized(self,cam_name_and_index,out):
+        """
+        record all the cameras with SyncCameraCapture, frames of all the cameras written together are grabbed at the same instant.
+        """
+        # per camera grabbers read the same handles, stop them before grabbing synchronously
+        self.stop_camera_captures()
+        # handles released for capture processes are opened again
+        self.open_cameras()
+
+        captures = {cam_name : self.get_camera(cam_index) for cam_name , cam_index in cam_name_and_index.items()}
+
+        # in mjpeg record format the jpeg payload from camera is written as it is , unless the frames are cropped
+        if self.args.record_format == "mjpeg" and not self.args.record_roi:
+            for cam_name , capture in captures.items():
+                if self.is_jpeg_granted(cam_name_and_index[cam_name]):
+                    capture.set(cv2.CAP_PROP_CONVERT_RGB,0)
+                else:
+                    self.logger.warning(f"{cam_name} : camera does not deliver jpeg payload , frames will be encoded to jpeg while writing")
+
+        sync_capture = SyncCameraCapture(captures,reconnect_timeout = self.args.reconnect_timeout)
+        sync_capture.start()
+        progress_thread = None
+        try:
+            ##### wait till all the cameras give valid frames with stable exposure #####
+            sanity_checks = {cam_name : FrameSanityCheck() for cam_name in captures.keys()}
+            warmed_up_cams = set()
+            skipped_frame_count = 0
+
+            while skipped_frame_count < self.args.max_warmup_frames:
+                ret , frame_set = self.read_camera_frame_set(sync_capture)
+                if not ret:
+                    continue
+                for cam_name , frame in frame_set.frames.items():
+                    if cam_name not in warmed_up_cams and sanity_checks[cam_name].update(frame):
+                        warmed_up_cams.add(cam_name)
+                if len(warmed_up_cams) == len(captures):
+                    break
+                skipped_frame_count += 1
+
+            for cam_name in captures.keys():
+                self.warmup_frame_count[cam_name] = skipped_frame_count
+                sync_capture.telemetry[cam_name].reset()
+                self.start_quality_gate(cam_name)
+            ############################################################################
+
+            # in paced recording all the videos are written at the lowest measured capture rate , FrameSets are paced together
+            pacer = None
+            if self.args.paced_recording:
+                fps = min(self.measure_capture_fps(cam_name,sync_capture.telemetry[cam_name]) for cam_name in captures.keys())
+                pacer = self.start_pacing(captures.keys(),fps,out)
+            record_frame_count = self.get_record_frame_count(pacer.fps if pacer is not None else None)
+
+            self.recording_done.clear()
+            self.recorded_frame_count = {cam_name : 0 for cam_name in captures.keys()}
+            self.target_frame_count = {cam_name : record_frame_count for cam_name in captures.keys()}
+
+            progress_thread = threading.Thread(target = self.print_recording_progress)
+            progress_thread.start()
+
+            # time between first and last grab of every FrameSet written
+            grab_spreads_ms = []
+
+            while len(grab_spreads_ms) < record_frame_count and max(self.get_rejected_frame_count(cam_name) for cam_name in captures.keys()) <= self.args.max_rejected_frames:
+                ret , frame_set = self.read_camera_frame_set(sync_capture)
+                if ret:
+                    # FrameSet is written only if frames of all the cameras are good
+                    frame_quality = {cam_name : self.check_frame_quality(cam_name,frame,len(grab_spreads_ms)) for cam_name , frame in frame_set.frames.items()}
+                    if not all(frame_quality.values()):
+                        # good frames of other cameras are not recorded either , they are not counted as accepted
+                        for cam_name , accepted in frame_quality.items():
+                            if accepted and cam_name in self.quality_gates:
+                                self.quality_gates[cam_name].drop_accepted()
+                        continue
+                    repeat_count = 1 if pacer is None else min(pacer.get_repeat_count(min(frame_set.grab_timestamps.values())),record_frame_count - len(grab_spreads_ms))
+                    for _ in range(repeat_count):
+                        out.write_frame_set(frame_set)
+                        grab_spreads_ms.append(frame_set.grab_spread_ms)
+                    for cam_name in frame_set.frames.keys():
+                        self.recorded_frame_count[cam_name] = len(grab_spreads_ms)
+        finally:
+            # grabber and progress are stopped even when a camera fails while recording
+            self.recording_done.set()
+            if progress_thread is not None:
+                progress_thread.join()
+            sync_capture.stop()
+
+        for cam_name in captures.keys():
+            self.save_capture_telemetry(cam_name,sync_capture.telemetry[cam_name],out)
+            self.save_quality_report(cam_name,out)
+            self.log_recording_report(cam_name,sync_capture)
+
+        # recording can stop with too many rejected frames before any FrameSet is written
+        if len(grab_spreads_ms):
+            self.logger.info(f"Grab spread between cameras : mean {round(sum(grab_spreads_ms) / len(grab_spreads_ms),2)} ms , max {max(grab_spreads_ms)} ms")
+        else:
+            self.logger.warning("No FrameSet recorded")
@@ -0,0 +1,97 @@
+import os
+import json
+
+# region of interest and downscale of recorded video for each BotType and camera
+# roi : [x , y , width , height] as fraction of frame , so the same profile is used for every resolution
+# step : every step'th pixel in both direction is kept , 1 to keep full resolution
+RecordRoiProfileTemplate = {
+    bot_type : {
+        cam_name : {"roi" : [0.0,0.0,1.0,1.0],"step" : 1}
+        for cam_name in ["FrontCam","RightCam","LeftCam"]
+    }
+    for bot_type in ["1","2"]
+}
+
+class RecordRoi:
+    """
+    Crop and downscale of the frames of one camera before encoding, applied as a numpy slice (view) of the frame.
+    size of output is kept even since mp4v can not encode odd width or height.
+    """
+
+    def __init__(self,width,height,roi = (0.0,0.0,1.0,1.0),step = 1):
+
+        self.width = width
+        self.height = height
+        self.step = max(1,int(step))
+
+        x0 = int(round(roi[0] * width))
+        y0 = int(round(roi[1] * height))
+        x1 = min(width,int(round((roi[0] + roi[2]) * width)))
+        y1 = min(height,int(round((roi[1] + roi[3]) * height)))
+
+        # number of pixels kept in each direction , rounded down to even
+        self.out_w = len(range(x0,x1,self.step)) // 2 * 2
+        self.out_h = len(range(y0,y1,self.step)) // 2 * 2
+
+        self.cols = slice(x0,x0 + self.out_w * self.step,self.step)
+        self.rows = slice(y0,y0 + self.out_h * self.step,self.step)
+
+    def is_full_frame(self):
+        return (self.out_w,self.out_h) == (self.width,self.height)
+
+    def get_frame_size(self):
+        return self.out_w , self.out_h
+
+    def apply(self,frame):
+        """
+        view of the frame with region of interest , no pixels are copied.
+        """
+        return frame[self.rows,self.cols]
+
+    def get_metadata(self):
+        """
+        geometry of the original frame and the region kept, to map the recorded video back to camera frame.
+        """
+        return {
+            "original_width"  : self.width,
+            "original_height" : self.height,
+            "roi_x"           : self.cols.start,
+            "roi_y"           : self.rows.start,
+            "roi_width"       : self.cols.stop - self.cols.start,
+            "roi_height"      : self.rows.stop - self.rows.start,
+            "step"            : self.step,
+            "width"           : self.out_w,
+            "height"          : self.out_h
+        }
+
+def get_roi_profile_path(json_path):
+    """
+    roi profile is kept next to CameraStartUpJson.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(json_path)),"RecordRoiProfile.json")
+
+def load_record_rois(profile_path,bot_type,width,height,cam_names):
+    """
+    read the roi profile of the BotType, returns camera name -> RecordRoi for the cameras which are not recorded in full frame.
+    profile is created from template if it does not exist.
+    """
+    if not os.path.exists(profile_path):
+        # written to temporary file and renamed , profile can be shared by the slots of calibration station
+        tmp_profile_path = f"{profile_path}.{os.getpid()}.tmp"
+        with open(tmp_profile_path,"w") as profile_file:
+            json.dump(RecordRoiProfileTemplate,profile_file,indent = 4)
+        os.replace(tmp_profile_path,profile_path)
+
+    with open(profile_path,"r") as profile_file:
+        profile = json.load(profile_file)
+
+    record_rois = dict()
+    for cam_name in cam_names:
+        cam_profile = profile.get(str(bot_type),{}).get(cam_name)
+        if cam_profile is None:
+            continue
+        record_roi = RecordRoi(width,height,cam_profile.get("roi",(0.0,0.0,1.0,1.0)),cam_profile.get("step",1))
+        if not record_roi.is_full_frame():
+            record_rois[cam_name] = record_roi
+
+    return record_rois
@@ -0,0 +1,117 @@
+import os
+import queue
+import threading
+
+from CamWriter import load_segment_manifest
+
+class SegmentPlayback:
+    """
+    Mixin which runs the VideoPlayback build on segments of the recorded videos.
+    In mode 0 the segments are played back in background as soon as they are closed, while the next camera is still recording,
+    the logs of all the segments of a camera are concatenated into the log file of the camera.
+    expects the child class to provide self.args, self.logger, self.video_dir, self.data_dir, self.log_file_name, self.build_name,
+    self.cam_name_and_index, self.startup_json_lock, update_param_in_camera_startup_json and overwrite_existing_offset.
+    """
+
+    # camera name -> (key of log file name , SelectCameraForOfflineMode)
+    segment_cam_params = {
+        "FrontCam" : ("front",0),
+        "RightCam" : ("right",1),
+        "LeftCam"  : ("left",2)
+    }
+
+    def __init__(self):
+
+        # (camera name , segment path) waiting to be played back , None to stop the worker
+        self.segment_queue = queue.Queue()
+        self.segment_worker = None
+        # (mode , camera name) -> logs of segments played back in order
+        self.segment_logs = dict()
+        # segments on which VideoPlayback build has failed
+        self.failed_segments = []
+
+    def queue_segment_for_playback(self,cam_name,segment_path):
+        """
+        called by CameraWriter when a segment is closed.
+        """
+        self.segment_queue.put((cam_name,segment_path))
+
+    def start_segment_playback(self):
+        """
+        start playing back the segments in mode 0 as they are recorded.
+        offsets are overwritten with zero before, same as before the first VideoPlayback execution.
+        """
+        self.overwrite_existing_offset()
+        self.update_param_in_camera_startup_json(ParamType = "DebugParams",HostCommnFlag = 0,HybridSwitch = False)
+
+        self.segment_worker = threading.Thread(target = self.run_segment_playback,name = "SegmentPlayback",daemon = True)
+        self.segment_worker.start()
+
+    def run_segment_playback(self):
+        while True:
+            segment = self.segment_queue.get()
+            if segment is None:
+                break
+            cam_name , segment_path = segment
+            self.execute_videoplayback_build_on_segment(cam_name,segment_path,mode = 0)
+
+    def get_segment_log_file(self,cam_name,segment_path,mode):
+        log_key , _ = self.segment_cam_params[cam_name]
+        log_stem = os.path.splitext(self.log_file_name[mode][log_key])[0]
+        segment_name = os.path.splitext(os.path.basename(segment_path))[0].split("_")[-1]
+        return os.path.join(self.data_dir,f"{log_stem}_{segment_name}.txt")
+
+    def execute_videoplayback_build_on_segment(self,cam_name,segment_path,mode):
+        """
+        run VideoPlayback build on single segment without printing progress, so it can run while recording.
+        """
+        _ , offline_cam = self.segment_cam_params[cam_name]
+        log_file = self.get_segment_log_file(cam_name,segment_path,mode)
+        cmd = f"{self.args.videoplayback_build} --offline -i {segment_path} -v > {log_file} 2>&1"
+
+        # camera selected in json must not change till the build has read it
+        with self.startup_json_lock:
+            self.update_param_in_camera_startup_json(ParamType = "DebugParams",SelectCameraForOfflineMode = offline_cam)
+            return_code = os.system(cmd)
+
+        if return_code == 0:
+            self.segment_logs.setdefault((mode,cam_name),[]).append(log_file)
+        else:
+            self.failed_segments.append(segment_path)
+
+    def merge_segment_logs(self,mode):
+        """
+        concatenate the logs of segments of each camera into the log file of camera.
+        """
+        for cam_name in self.cam_name_and_index.keys():
+            log_key , _ = self.segment_cam_params[cam_name]
+            with open(os.path.join(self.data_dir,self.log_file_name[mode][log_key]),"w") as log_file:
+                for segment_log in self.segment_logs.get((mode,cam_name),[]):
+                    with open(segment_log,"r") as segment_log_file:
+                        log_file.write(segment_log_file.read())
+
+    def generate_segment_logs(self,mode):
+        """
+        generate log of each camera from its segments, in mode 0 waits for the segments played back while recording.
+        returns False if VideoPlayback build has failed on any segment.
+        """
+        if mode == 0 and self.segment_worker is not None:
+            self.segment_queue.put(None)
+            self.segment_worker.join()
+            self.segment_worker = None
+        else:
+            self.update_param_in_camera_startup_json(ParamType = "DebugParams",HostCommnFlag = 0,HybridSwitch = False)
+            for cam_name in self.cam_name_and_index.keys():
+                manifest = load_segment_manifest(os.path.join(self.video_dir,self.get_video_file_name(cam_name)))
+                if manifest is None:
+                    continue
+                self.logger.info(f"Executing VideoPlayback build [{self.build_name}] with {len(manifest['segments'])} segments of {cam_name}")
+                for segment in manifest["segments"]:
+                    self.execute_videoplayback_build_on_segment(cam_name,os.path.join(self.video_dir,segment["file"]),mode)
+
+        if len(self.failed_segments):
+            self.logger.error(f"!!!! Error in Executing VideoPlayback Build with {', '.join(os.path.basename(segment) for segment in self.failed_segments)} !!!!")
+            return False
+
+        self.merge_segment_logs(mode)
+        return True
@@ -0,0 +1,382 @@
+import cv2
+import numpy
+import time
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+
+from CamTelemetry import CaptureTelemetry
+from CamCapture import CameraCaptureError , CaptureBackoff
+
+# index of counters in header of shared ring
+WRITE_SEQ = 0
+READ_SEQ = 1
+OVERRUN_COUNT = 2
+FAILURE_COUNT = 3
+# set by capture process when the camera is given up
+GAVE_UP = 4
+# sequence number of frame returned by last read, set by consumer and cleared once its buffer is swapped out of the ring
+HELD_SEQ = 5
+# index of frame buffer not mapped to any slot
+SPARE_BUFFER = 6
+COUNTER_COUNT = 7
+
+def get_header_size(ring_size):
+    """
+    size in bytes of header of shared ring, counters + seq , buffer index , ndim , shape and timestamps of every slot.
+    """
+    return 8 * (COUNTER_COUNT + ring_size * 8)
+
+def get_header_views(buf,ring_size):
+    """
+    numpy views into header of shared ring, same layout is used by capture process and consumer.
+    """
+    counters = numpy.ndarray((COUNTER_COUNT,),dtype = numpy.int64,buffer = buf)
+    offset = counters.nbytes
+    # sequence number of frame held in each slot, -1 when the slot is empty or being written
+    slot_seq = numpy.ndarray((ring_size,),dtype = numpy.int64,buffer = buf,offset = offset)
+    offset += slot_seq.nbytes
+    # index of frame buffer mapped to each slot , there is one buffer more than slots
+    slot_buffer = numpy.ndarray((ring_size,),dtype = numpy.int64,buffer = buf,offset = offset)
+    offset += slot_buffer.nbytes
+    # ndim followed by shape of frame held in each slot , jpeg payloads are 1-D
+    slot_shape = numpy.ndarray((ring_size,4),dtype = numpy.int64,buffer = buf,offset = offset)
+    offset += slot_shape.nbytes
+    # monotonic receive time and driver timestamp (CAP_PROP_POS_MSEC) of frame held in each slot
+    slot_timestamps = numpy.ndarray((ring_size,2),dtype = numpy.float64,buffer = buf,offset = offset)
+    return counters , slot_seq , slot_buffer , slot_shape , slot_timestamps
+
+def reopen_camera(capture,device,serial_number,profile):
+    """
+    open the camera again at its current device node, returns (capture , device).
+    """
+    # udev is scanned only in capture process which has lost its camera
+    from CamContext import CamContext
+
+    capture.release()
+    device = CamContext().get_device_node(serial_number) or device
+    return profile.open(device,serial_number) , device
+
+def run_capture_process(device,serial_number,profile,frame_shm_name,header_shm_name,ring_size,slot_size,frame_ready,running,opened,passthrough_request,passthrough_state,reconnect_timeout):
+    """
+    body of capture process, reads frames of one camera into the shared ring till running is cleared.
+    failed reads are retried with backoff and the camera is reopened, the process exits if no frame is grabbed within reconnect_timeout.
+    """
+    frame_shm = shared_memory.SharedMemory(name = frame_shm_name)
+    header_shm = shared_memory.SharedMemory(name = header_shm_name)
+
+    slot_buffers = numpy.ndarray((ring_size + 1,slot_size),dtype = numpy.uint8,buffer = frame_shm.buf)
+    counters , slot_seq , slot_buffer , slot_shape , slot_timestamps = get_header_views(header_shm.buf,ring_size)
+
+    capture = profile.open(device,serial_number)
+    opened.set()
+
+    frame_size = profile.width * profile.height * 3
+    passthrough = 0
+    backoff = CaptureBackoff(timeout = reconnect_timeout)
+
+    while running.is_set():
+
+        # passthrough of jpeg payload is switched by consumer
+        if passthrough_request.value != passthrough:
+            passthrough = passthrough_request.value
+            capture.set(cv2.CAP_PROP_CONVERT_RGB,0 if passthrough else 1)
+            passthrough_state.value = int(passthrough and not bool(capture.get(cv2.CAP_PROP_CONVERT_RGB)))
+
+        with frame_ready:
+            write_seq = int(counters[WRITE_SEQ])
+            read_seq = int(counters[READ_SEQ])
+            slot = write_seq % ring_size
+            # slot still holds a frame that is not consumed, drop the oldest frame
+            if read_seq <= write_seq - ring_size:
+                counters[OVERRUN_COUNT] += write_seq - ring_size - read_seq + 1
+                counters[READ_SEQ] = write_seq - ring_size + 1
+            # frame returned by last read is still in use by consumer, read into the spare buffer instead
+            held_seq = int(counters[HELD_SEQ])
+            if held_seq >= 0 and held_seq % ring_size == slot:
+                slot_buffer[slot] , counters[SPARE_BUFFER] = int(counters[SPARE_BUFFER]) , int(slot_buffer[slot])
+                counters[HELD_SEQ] = -1
+            slot_seq[slot] = -1
+            buffer_index = int(slot_buffer[slot])
+
+        # decode straight into the shared slot when the frame is of requested size
+        slot_frame = slot_buffers[buffer_index,:frame_size].reshape(profile.height,profile.width,3)
+        ret , frame = capture.read(image = slot_frame)
+        receive_timestamp = time.monotonic()
+        driver_timestamp = capture.get(cv2.CAP_PROP_POS_MSEC)
+
+        if ret and frame is not slot_frame:
+            # jpeg payload or frame of different size, copy it into slot if it fits
+            if frame.nbytes > slot_size:
+                ret = False
+            else:
+                slot_buffers[buffer_index,:frame.nbytes] = frame.reshape(-1)
+
+        if not ret:
+            with frame_ready:
+                counters[FAILURE_COUNT] += 1
+            if backoff.is_expired():
+                with frame_ready:
+                    counters[GAVE_UP] = 1
+                    frame_ready.notify_all()
+                break
+            # reopen from second retry on , passthrough is applied again on next iteration
+            if backoff.wait() >= 2:
+                capture , device = reopen_camera(capture,device,serial_number,profile)
+                passthrough = 0
+            continue
+
+        backoff.reset()
+        with frame_ready:
+            slot_shape[slot] = (frame.ndim,) + frame.shape + (0,) * (3 - frame.ndim)
+            slot_timestamps[slot] = (receive_timestamp,driver_timestamp)
+            slot_seq[slot] = write_seq
+            counters[WRITE_SEQ] = write_seq + 1
+            frame_ready.notify_all()
+
+    capture.release()
+
+    del slot_buffers , counters , slot_seq , slot_buffer , slot_shape , slot_timestamps
+    frame_shm.close()
+    header_shm.close()
+
+class SharedCameraCapture:
+    """
+    Grabber running in its own process, so capture and decode of each camera does not compete for the GIL with
+    writing and marker detection. Frames are published into a ring in multiprocessing.shared_memory and
+    the consumer gets read-only numpy views into it without copying.
+    Has the same read interface as CameraCapture, a view stays valid till the ring wraps around and
+    the view returned by last read till next read.
+    A failing camera is reopened by the capture process, reads raise CameraCaptureError once it is given up.
+    """
+    def __init__(self, camera_index = 0, queue_size = 10 , serial_num = None , profile = None , reconnect_timeout = 10.0):
+
+        self.logger = logging.getLogger()
+
+        self.cam_index = camera_index
+        self.serial_number = serial_num
+        self.profile = profile
+        self.reconnect_timeout = reconnect_timeout
+        self.img_w , self.img_h = profile.width , profile.height
+
+        # process is spawned , forking a process which already has opened cameras and running threads is not safe
+        context = multiprocessing.get_context("spawn")
+
+        ###### ring of frame buffers in shared memory ######
+        self.ring_size = queue_size
+        # room for a BGR frame of requested size, jpeg payloads are always smaller
+        self.slot_size = self.img_w * self.img_h * 3
+        # one buffer more than slots , swapped in while consumer holds the frame of slot being written
+        self.frame_shm = shared_memory.SharedMemory(create = True,size = (self.ring_size + 1) * self.slot_size)
+        self.header_shm = shared_memory.SharedMemory(create = True,size = get_header_size(self.ring_size))
+        self.slot_buffers = numpy.ndarray((self.ring_size + 1,self.slot_size),dtype = numpy.uint8,buffer = self.frame_shm.buf)
+        self.counters , self.slot_seq , self.slot_buffer , self.slot_shape , self.slot_timestamps = get_header_views(self.header_shm.buf,self.ring_size)
+        self.counters[:] = 0
+        self.counters[HELD_SEQ] = -1
+        self.counters[SPARE_BUFFER] = self.ring_size
+        self.slot_seq[:] = -1
+        self.slot_buffer[:] = numpy.arange(self.ring_size)
+        self.frame_ready = context.Condition()
+        #####################################################
+
+        self.running = context.Event()
+        self.running.set()
+        self.opened = context.Event()
+        # requested and granted state of jpeg passthrough, -1 till capture process has applied the request
+        self.passthrough_request = context.Value("i",0,lock = False)
+        self.passthrough_state = context.Value("i",0,lock = False)
+        self.passthrough = False
+
+        self.process = context.Process(target = run_capture_process,
+                                       args = (self.cam_index,self.serial_number,self.profile,self.frame_shm.name,self.header_shm.name,
+                                               self.ring_size,self.slot_size,self.frame_ready,self.running,self.opened,
+                                               self.passthrough_request,self.passthrough_state,reconnect_timeout),
+                                       name = f"Capture{self.serial_number}",
+                                       daemon = True)
+
+        # timing of frames , collected from slot timestamps as the consumer reads
+        self.telemetry = CaptureTelemetry()
+        # sequence number of next frame to be added to telemetry
+        self.telemetry_seq = 0
+        self.reported_failure_count = 0
+        # monotonic receive time of frame returned by last read
+        self.read_timestamp = None
+
+    def start(self,open_timeout = 10.0):
+        self.process.start()
+        if not self.opened.wait(open_timeout):
+            self.logger.error(f"!!! Capture process of camera {self.serial_number} did not open {self.cam_index} in {open_timeout} s !!!")
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    @property
+    def overrun_count(self):
+        return int(self.counters[OVERRUN_COUNT])
+
+    @property
+    def read_seq(self):
+        return int(self.counters[READ_SEQ])
+
+    @property
+    def write_seq(self):
+        return int(self.counters[WRITE_SEQ])
+
+    def set_passthrough(self,enabled,timeout = 2.0):
+        """
+        deliver the compressed payload from camera without decoding it to BGR.
+        returns True if the backend has accepted it, frames are 1-D jpeg buffers (MJPG) or packed yuyv frames (YUYV) in this mode.
+        """
+        self.passthrough_state.value = -1
+        self.passthrough_request.value = int(enabled)
+        deadline = time.monotonic() + timeout
+        while self.passthrough_state.value == -1 and time.monotonic() < deadline and self.is_alive():
+            time.sleep(0.01)
+        self.passthrough = self.passthrough_state.value == 1
+        return self.passthrough
+
+    def update_telemetry(self):
+        """
+        add the frames published since last call to telemetry, frames already overwritten in ring are missed.
+        called with frame_ready held.
+        """
+        write_seq = int(self.counters[WRITE_SEQ])
+        for seq in range(max(self.telemetry_seq,write_seq - self.ring_size),write_seq):
+            slot = seq % self.ring_size
+            if self.slot_seq[slot] == seq:
+                receive_timestamp , driver_timestamp = self.slot_timestamps[slot]
+                self.telemetry.record_frame(float(driver_timestamp),float(receive_timestamp))
+        self.telemetry_seq = write_seq
+
+        failure_count = int(self.counters[FAILURE_COUNT])
+        for _ in range(failure_count - self.reported_failure_count):
+            self.telemetry.record_failure()
+        self.reported_failure_count = failure_count
+
+    def refresh_telemetry(self):
+        """
+        add the frames published by capture process to telemetry without reading them.
+        """
+        with self.frame_ready:
+            self.update_telemetry()
+
+    def get_view(self,seq):
+        """
+        read-only view of the frame with given sequence number, None if the slot is overwritten.
+        """
+        slot = seq % self.ring_size
+        if self.slot_seq[slot] != seq:
+            return None
+        ndim = int(self.slot_shape[slot,0])
+        shape = tuple(int(dim) for dim in self.slot_shape[slot,1:1 + ndim])
+        view = self.slot_buffers[int(self.slot_buffer[slot]),:int(numpy.prod(shape))].reshape(shape)
+        view.flags.writeable = False
+        return view
+
+    def read_frame(self,timeout = None):
+        """
+        blocking read of next frame in order, returns (ret, frame view) similar to cv2.VideoCapture.read.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.frame_ready:
+            # wait in short steps to notice the capture process exiting
+            while self.read_seq >= self.write_seq and self.running.is_set() and self.is_alive():
+                wait_time = 0.5 if deadline is None else min(0.5,deadline - time.monotonic())
+                if wait_time <= 0:
+                    break
+                self.frame_ready.wait(wait_time)
+            self.update_telemetry()
+            read_seq = self.read_seq
+            if read_seq >= self.write_seq and self.counters[GAVE_UP]:
+                raise CameraCaptureError(self.serial_number,self.cam_index,f"no frame for {self.reconnect_timeout} s",int(self.counters[FAILURE_COUNT]))
+            # capture process has exited without giving up the camera (e.g. error while opening)
+            if read_seq >= self.write_seq and self.running.is_set() and not self.is_alive():
+                raise CameraCaptureError(self.serial_number,self.cam_index,f"capture process exited with code {self.process.exitcode}",int(self.counters[FAILURE_COUNT]))
+            if read_seq >= self.write_seq:
+                return False , None
+            frame = self.get_view(read_seq)
+            self.read_timestamp = float(self.slot_timestamps[read_seq % self.ring_size,0])
+            self.counters[HELD_SEQ] = read_seq
+            self.counters[READ_SEQ] = read_seq + 1
+        return frame is not None , frame
+
+    def get_frame(self):
+        """
+        non blocking read of next frame in order, None if no new frame is available.
+        """
+        with self.frame_ready:
+            self.update_telemetry()
+            read_seq = self.read_seq
+            if read_seq >= self.write_seq:
+                return None
+            frame = self.get_view(read_seq)
+            self.read_timestamp = float(self.slot_timestamps[read_seq % self.ring_size,0])
+            self.counters[HELD_SEQ] = read_seq
+            self.counters[READ_SEQ] = read_seq + 1
+        return frame
+
+    def get_latest_frame(self):
+        """
+        read-only view of most recent frame, None if no frame is grabbed yet.
+        """
+        with self.frame_ready:
+            if self.write_seq == 0:
+                return None
+            self.counters[HELD_SEQ] = self.write_seq - 1
+            return self.get_view(self.write_seq - 1)
+
+    def skip_to_latest(self):
+        """
+        discard the frames which are not consumed yet, next read returns only the frames grabbed after this call.
+        """
+        with self.frame_ready:
+            self.counters[READ_SEQ] = self.write_seq
+            self.counters[OVERRUN_COUNT] = 0
+            self.telemetry_seq = self.write_seq
+
+    def rewind(self,since_timestamp = 0.0,max_frames = None):
+        """
+        make the frames still held in ring (pre-roll) readable again, oldest first.
+        only the frames received after since_timestamp (monotonic) are returned by next reads.
+        max_frames : max number of frames rewound , to keep slots free between grabber and the frame being recorded.
+        telemetry is trimmed to the frames rewound. returns the number of frames rewound.
+        """
+        with self.frame_ready:
+            self.update_telemetry()
+            write_seq = self.write_seq
+            seq = max(0,write_seq - min(self.ring_size,max_frames or self.ring_size))
+            while seq < write_seq:
+                slot = seq % self.ring_size
+                if self.slot_seq[slot] == seq and self.slot_timestamps[slot,0] >= since_timestamp:
+                    break
+                seq += 1
+            self.counters[READ_SEQ] = seq
+            self.counters[OVERRUN_COUNT] = 0
+            # telemetry covers only the frames recorded from now on
+            self.telemetry.trim(float(self.slot_timestamps[seq % self.ring_size,0]) if seq < write_seq else time.monotonic())
+            return write_seq - seq
+
+    def stop(self,timeout = 5.0):
+        self.running.clear()
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        if self.process.is_alive():
+            self.process.join(timeout)
+        if self.process.is_alive():
+            self.logger.warning(f"Capture process of camera {self.serial_number} did not exit , terminating it")
+            self.process.terminate()
+            self.process.join()
+
+        # shared memory can only be closed once no view into it is left, counters are kept for the report
+        self.counters = self.counters.copy()
+        self.slot_seq = self.slot_seq.copy()
+        self.slot_buffer = self.slot_buffer.copy()
+        self.slot_shape = self.slot_shape.copy()
+        self.slot_timestamps = self.slot_timestamps.copy()
+        self.slot_buffers = None
+        for shm in (self.frame_shm,self.header_shm):
+            try:
+                shm.close()
+            except BufferError:
+                self.logger.warning(f"Frames of camera {self.serial_number} are still in use , shared memory is unlinked without closing")
+            shm.unlink()
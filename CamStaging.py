@@ -0,0 +1,95 @@
+import os
+import time
+import queue
+import hashlib
+import logging
+import threading
+
+class StagingFlusher(threading.Thread):
+    """
+    Copies the files recorded in staging directory (tmpfs / /dev/shm) to the persistent directory in background.
+    Copy is limited to bandwidth bytes per second so it does not compete with recording and VideoPlayback for the sd card,
+    every copy is verified with sha256 of source and destination.
+    """
+
+    def __init__(self,dest_dir,bandwidth = 20 * 1024 * 1024,chunk_size = 1024 * 1024):
+
+        super().__init__(daemon = True)
+        self.logger = logging.getLogger()
+
+        self.dest_dir = dest_dir
+        # max bytes per second written to destination , None for no limit
+        self.bandwidth = bandwidth
+        self.chunk_size = chunk_size
+
+        self.file_queue = queue.Queue()
+        # source path -> True if copy is verified , False if copy failed
+        self.results = dict()
+        self.queued_paths = set()
+        self.copied_bytes = 0
+
+    def copy(self,src_path):
+        """
+        queue the file to be copied, files already queued are skipped.
+        """
+        if src_path in self.queued_paths:
+            return
+        self.queued_paths.add(src_path)
+        self.file_queue.put(src_path)
+
+    def get_file_hash(self,path):
+        file_hash = hashlib.sha256()
+        with open(path,"rb") as src_file:
+            for chunk in iter(lambda : src_file.read(self.chunk_size),b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def copy_file(self,src_path):
+        """
+        copy single file in chunks within bandwidth, returns True if sha256 of copy matches the source.
+        """
+        dest_path = os.path.join(self.dest_dir,os.path.basename(src_path))
+        src_hash = hashlib.sha256()
+        start_time = time.monotonic()
+        file_bytes = 0
+
+        with open(src_path,"rb") as src_file , open(dest_path,"wb") as dest_file:
+            for chunk in iter(lambda : src_file.read(self.chunk_size),b""):
+                src_hash.update(chunk)
+                dest_file.write(chunk)
+                file_bytes += len(chunk)
+                # sleep till the copy is back within bandwidth
+                if self.bandwidth:
+                    ahead = file_bytes / self.bandwidth - (time.monotonic() - start_time)
+                    if ahead > 0:
+                        time.sleep(ahead)
+            dest_file.flush()
+            os.fsync(dest_file.fileno())
+            # drop the copy from page cache , so it is verified with what is on the card
+            if hasattr(os,"posix_fadvise"):
+                os.posix_fadvise(dest_file.fileno(),0,0,os.POSIX_FADV_DONTNEED)
+
+        self.copied_bytes += file_bytes
+        return self.get_file_hash(dest_path) == src_hash.hexdigest()
+
+    def run(self):
+        while True:
+            src_path = self.file_queue.get()
+            if src_path is None:
+                break
+            try:
+                self.results[src_path] = self.copy_file(src_path)
+            except OSError as e:
+                self.logger.error(f"!!! Failed to copy {src_path} to {self.dest_dir} : {e} !!!")
+                self.results[src_path] = False
+            if not self.results[src_path]:
+                self.logger.error(f"!!! Checksum of {os.path.basename(src_path)} copied to {self.dest_dir} does not match !!!")
+
+    def finish(self):
+        """
+        wait till all the queued files are copied, returns True if all of them are verified.
+        """
+        self.file_queue.put(None)
+        if self.is_alive():
+            self.join()
+        return all(self.results.values())
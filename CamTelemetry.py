@@ -0,0 +1,91 @@
+import json
+import threading
+import numpy
+
+class CaptureTelemetry:
+    """
+    Per camera capture timing , driver timestamp (CAP_PROP_POS_MSEC) and monotonic receive time of every frame,
+    number of failed reads and histogram of gap between consecutive frames.
+    """
+
+    def __init__(self,gap_bin_edges_ms = (0,50,62,72,90,134,200,334,1000)):
+
+        # edges of inter frame gap histogram in ms , last bin is open ended
+        self.gap_bin_edges_ms = list(gap_bin_edges_ms) + [numpy.inf]
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.driver_timestamps = []
+            self.receive_timestamps = []
+            self.read_failure_count = 0
+
+    def trim(self,since_timestamp):
+        """
+        keep only the frames received from since_timestamp (monotonic) on , failed reads before are not known by time and are dropped.
+        """
+        with self.lock:
+            first_index = next((index for index , timestamp in enumerate(self.receive_timestamps) if timestamp >= since_timestamp),len(self.receive_timestamps))
+            self.driver_timestamps = self.driver_timestamps[first_index:]
+            self.receive_timestamps = self.receive_timestamps[first_index:]
+            self.read_failure_count = 0
+
+    def record_frame(self,driver_timestamp_ms,receive_timestamp):
+        with self.lock:
+            self.driver_timestamps.append(driver_timestamp_ms)
+            self.receive_timestamps.append(receive_timestamp)
+
+    def record_failure(self):
+        with self.lock:
+            self.read_failure_count += 1
+
+    def get_summary(self):
+        """
+        summary of the capture , effective fps , gap statistics and gap histogram.
+        """
+        with self.lock:
+            receive_timestamps = numpy.array(self.receive_timestamps)
+            read_failure_count = self.read_failure_count
+
+        summary = {
+            "frame_count"        : len(receive_timestamps),
+            "read_failure_count" : read_failure_count,
+            "effective_fps"      : None,
+            "gap_mean_ms"        : None,
+            "gap_p95_ms"         : None,
+            "gap_max_ms"         : None,
+            "gap_histogram"      : dict()
+        }
+
+        if len(receive_timestamps) < 2:
+            return summary
+
+        gaps_ms = numpy.diff(receive_timestamps) * 1000
+        hist , _ = numpy.histogram(gaps_ms,bins = self.gap_bin_edges_ms)
+
+        summary["effective_fps"] = round((len(receive_timestamps) - 1) / (receive_timestamps[-1] - receive_timestamps[0]),2)
+        summary["gap_mean_ms"] = round(float(gaps_ms.mean()),2)
+        summary["gap_p95_ms"] = round(float(numpy.percentile(gaps_ms,95)),2)
+        summary["gap_max_ms"] = round(float(gaps_ms.max()),2)
+        summary["gap_histogram"] = {f"{low}-{high}" if high != numpy.inf else f">{low}" : int(count)
+                                    for low , high , count in zip(self.gap_bin_edges_ms[:-1],self.gap_bin_edges_ms[1:],hist)}
+
+        return summary
+
+    def save(self,telemetry_path):
+        """
+        write the summary and timestamps of every frame as json sidecar, returns the summary.
+        """
+        summary = self.get_summary()
+        telemetry = dict(summary)
+
+        with self.lock:
+            start_time = self.receive_timestamps[0] if len(self.receive_timestamps) else 0
+            telemetry["driver_timestamps_ms"] = list(self.driver_timestamps)
+            telemetry["receive_timestamps_s"] = [round(timestamp - start_time,6) for timestamp in self.receive_timestamps]
+
+        with open(telemetry_path,"w") as telemetry_file:
+            json.dump(telemetry,telemetry_file,indent = 4)
+
+        return summary
@@ -1,14 +1,472 @@
 import cv2
 import os 
+import struct
+import numpy
+import threading
+import queue
+import time
+import json
+import sys
 from ParseParams import *
 
+def write_frame(writer,frame,timestamp = None):
+    """
+    write the frame with its capture timestamp , cv2.VideoWriter does not keep timestamps and gets only the frame.
+    """
+    if isinstance(writer,cv2.VideoWriter):
+        writer.write(frame)
+    else:
+        writer.write(frame,timestamp)
+
+class MjpegAviWriter:
+    """
+    Minimal AVI (RIFF) muxer for MJPEG frames, used to write the jpeg payload from camera as it is without decode/re-encode.
+    provides the same write/release/isOpened calls as cv2.VideoWriter.
+    """
+
+    def __init__(self,video_path,fps,frame_size,jpeg_quality = 95):
+
+        self.width , self.height = frame_size
+        self.fps = fps
+        self.jpeg_quality = jpeg_quality
+
+        self.video_file = open(video_path,"wb")
+        # (offset from movi list , size) of every frame for idx1 index
+        self.frame_index = []
+        self.max_frame_size = 0
+
+        self.write_header()
+
+    def write_header(self):
+        """
+        write RIFF header with placeholders for sizes and frame count, patched in release().
+        """
+        usec_per_frame = int(1000000 / self.fps)
+
+        avih = struct.pack("<14I",
+                           usec_per_frame,          # dwMicroSecPerFrame
+                           0,                       # dwMaxBytesPerSec
+                           0,                       # dwPaddingGranularity
+                           0x10,                    # dwFlags , AVIF_HASINDEX
+                           0,                       # dwTotalFrames , patched on release
+                           0,                       # dwInitialFrames
+                           1,                       # dwStreams
+                           0,                       # dwSuggestedBufferSize , patched on release
+                           self.width,              # dwWidth
+                           self.height,             # dwHeight
+                           0,0,0,0)                 # dwReserved
+        strh = struct.pack("<4s4sIHHIIIIIIiI4h",
+                           b"vids",b"MJPG",
+                           0,                       # dwFlags
+                           0,0,                     # wPriority , wLanguage
+                           0,                       # dwInitialFrames
+                           1000,                    # dwScale
+                           int(self.fps * 1000),    # dwRate
+                           0,                       # dwStart
+                           0,                       # dwLength , patched on release
+                           0,                       # dwSuggestedBufferSize , patched on release
+                           -1,                      # dwQuality
+                           0,                       # dwSampleSize
+                           0,0,self.width,self.height) # rcFrame
+        strf = struct.pack("<IiiHH4sIiiII",
+                           40,self.width,self.height,1,24,b"MJPG",self.width * self.height * 3,0,0,0,0)
+
+        strl = b"strl" + b"strh" + struct.pack("<I",len(strh)) + strh + b"strf" + struct.pack("<I",len(strf)) + strf
+        hdrl = b"hdrl" + b"avih" + struct.pack("<I",len(avih)) + avih + b"LIST" + struct.pack("<I",len(strl)) + strl
+
+        self.video_file.write(b"RIFF" + struct.pack("<I",0) + b"AVI ")
+        self.video_file.write(b"LIST" + struct.pack("<I",len(hdrl)) + hdrl)
+
+        # offsets of the fields to be patched while releasing
+        self.total_frames_pos = 12 + 8 + 4 + 8 + 16
+        self.avih_buffer_size_pos = self.total_frames_pos + 12
+        strh_pos = 12 + 8 + 4 + 8 + len(avih) + 8 + 4 + 8
+        self.length_pos = strh_pos + 32
+        self.strh_buffer_size_pos = strh_pos + 36
+
+        self.movi_pos = self.video_file.tell()
+        self.video_file.write(b"LIST" + struct.pack("<I",0) + b"movi")
+
+    def isOpened(self):
+        return not self.video_file.closed
+
+    def write(self,frame,timestamp = None):
+        """
+        write the jpeg payload grabbed from camera , decoded frames are encoded to jpeg.
+        """
+        if frame.ndim == 3:
+            _ , frame = cv2.imencode(".jpg",frame,[cv2.IMWRITE_JPEG_QUALITY,self.jpeg_quality])
+
+        payload = numpy.ascontiguousarray(frame).data
+        frame_size = payload.nbytes
+
+        self.frame_index.append((self.video_file.tell() - self.movi_pos - 8,frame_size))
+        self.max_frame_size = max(self.max_frame_size,frame_size)
+
+        self.video_file.write(b"00dc" + struct.pack("<I",frame_size))
+        self.video_file.write(payload)
+        # chunks are word aligned
+        if frame_size % 2:
+            self.video_file.write(b"\0")
+
+    def release(self):
+        """
+        write the idx1 index and patch sizes and frame count in header.
+        """
+        if self.video_file.closed:
+            return
+
+        movi_end = self.video_file.tell()
+
+        self.video_file.write(b"idx1" + struct.pack("<I",16 * len(self.frame_index)))
+        for frame_offset , frame_size in self.frame_index:
+            # AVIIF_KEYFRAME , every jpeg frame is a key frame
+            self.video_file.write(b"00dc" + struct.pack("<III",0x10,frame_offset,frame_size))
+
+        file_end = self.video_file.tell()
+
+        patch_fields = [(4,file_end - 8),
+                        (self.movi_pos + 4,movi_end - self.movi_pos - 8),
+                        (self.total_frames_pos,len(self.frame_index)),
+                        (self.avih_buffer_size_pos,self.max_frame_size),
+                        (self.length_pos,len(self.frame_index)),
+                        (self.strh_buffer_size_pos,self.max_frame_size)]
+        for field_pos , field_val in patch_fields:
+            self.video_file.seek(field_pos)
+            self.video_file.write(struct.pack("<I",field_val))
+
+        self.video_file.close()
+
+class RawFrameWriter:
+    """
+    Writes the frames without any encoding into a memory mapped .npy file of fixed stride,
+    with a small json header next to it holding width, height, pixel format, fps and timestamp of each frame.
+    provides the same write/release/isOpened calls as cv2.VideoWriter.
+    """
+
+    def __init__(self,video_path,fps,frame_size,frame_count):
+
+        self.video_path = video_path
+        self.header_path = os.path.splitext(video_path)[0] + ".json"
+        self.width , self.height = frame_size
+        self.fps = fps
+
+        # file is preallocated for given number of frames
+        self.frames = numpy.lib.format.open_memmap(self.video_path,mode = "w+",dtype = numpy.uint8,shape = (frame_count,self.height,self.width,3))
+        self.frame_count = 0
+        self.timestamps = []
+
+    def isOpened(self):
+        return self.frames is not None
+
+    def write(self,frame,timestamp = None):
+        """
+        copy the frame into next slot of the file , jpeg payloads are decoded first.
+        timestamp : monotonic receive time of frame from camera , time of writing if not known.
+        """
+        if self.frame_count >= self.frames.shape[0]:
+            return
+        if frame.ndim != 3:
+            frame = cv2.imdecode(frame,cv2.IMREAD_COLOR)
+
+        self.frames[self.frame_count] = frame
+        self.timestamps.append(timestamp if timestamp is not None else time.monotonic())
+        self.frame_count += 1
+
+    def release(self):
+        """
+        flush the frames to file and write the header.
+        """
+        if self.frames is None:
+            return
+
+        self.frames.flush()
+        self.frames = None
+
+        header = {
+            "width"        : self.width,
+            "height"       : self.height,
+            "format"       : "BGR24",
+            "fps"          : self.fps,
+            "frame_count"  : self.frame_count,
+            "timestamps"   : [round(timestamp - self.timestamps[0],6) for timestamp in self.timestamps]
+        }
+        with open(self.header_path,"w") as header_file:
+            json.dump(header,header_file,indent = 4)
+
+def load_raw_frames(raw_path):
+    """
+    open the frames written by RawFrameWriter without decoding, returns (frames , header).
+    frames is a read-only memory map of shape (frame_count , height , width , 3).
+    """
+    with open(os.path.splitext(raw_path)[0] + ".json","r") as header_file:
+        header = json.load(header_file)
+
+    frames = numpy.load(raw_path,mmap_mode = "r")
+
+    return frames[:header["frame_count"]] , header
+
+def convert_raw_to_video(raw_path,video_path,fourcc = "mp4v"):
+    """
+    encode the frames written by RawFrameWriter as video , for VideoPlayback build or archiving.
+    """
+    frames , header = load_raw_frames(raw_path)
+
+    writer = cv2.VideoWriter(video_path,cv2.VideoWriter_fourcc(*fourcc),header["fps"],(header["width"],header["height"]))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+class AsyncStreamWriter(threading.Thread):
+    """
+    Background writer for one stream, so that encoding does not block the capture loop.
+    Frames are copied into a bounded pool of reusable buffers and encoded in this thread.
+    When all the buffers are in use write() waits for max_stall seconds and then drops the frame.
+    """
+
+    def __init__(self,writer,queue_size = 30,max_stall = 1.0,name = None):
+
+        super().__init__(daemon = True,name = name)
+
+        self.writer = writer
+        self.queue_size = queue_size
+        self.max_stall = max_stall
+
+        # frames waiting to be encoded, None is put to stop the thread
+        self.frame_queue = queue.Queue()
+        # buffers which can be reused for next frame
+        self.free_buffers = queue.Queue()
+        self.allocated_buffers = 0
+
+        ##### backpressure statistics #####
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
+        # max time in seconds write() had to wait for a free buffer
+        self.max_stall_time = 0.0
+        ###################################
+
+        self.start()
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def get_buffer(self,frame):
+        """
+        get a buffer to copy the frame , None if no buffer got free within max_stall.
+        """
+        try:
+            return self.free_buffers.get_nowait()
+        except queue.Empty:
+            pass
+
+        if self.allocated_buffers < self.queue_size:
+            self.allocated_buffers += 1
+            return numpy.empty_like(frame)
+
+        try:
+            return self.free_buffers.get(timeout = self.max_stall)
+        except queue.Empty:
+            return None
+
+    def write(self,frame,timestamp = None):
+        """
+        queue the frame for writing, returns False if frame is dropped.
+        """
+        start_time = time.monotonic()
+
+        buffer = self.get_buffer(frame)
+
+        self.max_stall_time = max(self.max_stall_time,time.monotonic() - start_time)
+
+        if buffer is None:
+            self.frames_dropped += 1
+            return False
+
+        # jpeg payloads differ in size for every frame
+        if buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = numpy.empty_like(frame)
+        numpy.copyto(buffer,frame)
+
+        self.frame_queue.put((buffer,timestamp))
+        self.max_queue_depth = max(self.max_queue_depth,self.frame_queue.qsize())
+        return True
+
+    def run(self):
+        while True:
+            queued_frame = self.frame_queue.get()
+            if queued_frame is None:
+                self.frame_queue.task_done()
+                break
+            buffer , timestamp = queued_frame
+            write_frame(self.writer,buffer,timestamp)
+            self.frames_written += 1
+            self.free_buffers.put(buffer)
+            self.frame_queue.task_done()
+
+    def flush(self):
+        """
+        wait till all the queued frames are written.
+        """
+        self.frame_queue.join()
+
+    def release(self):
+        """
+        drain the queued frames and release the writer.
+        """
+        if self.is_alive():
+            self.frame_queue.put(None)
+            self.join()
+        self.writer.release()
+
+    def get_stats(self):
+        return {
+            "frames_written"  : self.frames_written,
+            "frames_dropped"  : self.frames_dropped,
+            "max_queue_depth" : self.max_queue_depth,
+            "max_stall_ms"    : round(self.max_stall_time * 1000,2)
+        }
+
+class SegmentedWriter:
+    """
+    Rolls the video of one camera over into segments of segment_frames frames, so the completed segments can be
+    played back while recording is going on. Segments are listed in a json manifest next to them,
+    on_segment_complete(segment_path) is called as soon as a segment is closed.
+    provides the same write/release/isOpened calls as cv2.VideoWriter.
+    """
+
+    def __init__(self,video_path,open_writer,segment_frames,fps,on_segment_complete = None):
+
+        self.video_stem , self.video_ext = os.path.splitext(video_path)
+        self.manifest_path = self.video_stem + ".segments.json"
+        # function to open the writer of a segment with segment path
+        self.open_writer = open_writer
+        self.segment_frames = segment_frames
+        self.fps = fps
+        self.on_segment_complete = on_segment_complete
+
+        self.writer = None
+        self.segment_frame_count = 0
+        self.frame_count = 0
+        self.segments = []
+
+    def isOpened(self):
+        return self.writer is None or self.writer.isOpened()
+
+    def get_segment_path(self,segment_index):
+        return f"{self.video_stem}_seg{segment_index:03d}{self.video_ext}"
+
+    def write(self,frame,timestamp = None):
+        if self.writer is None:
+            self.writer = self.open_writer(self.get_segment_path(len(self.segments)))
+            self.segment_frame_count = 0
+
+        write_frame(self.writer,frame,timestamp)
+        self.segment_frame_count += 1
+        self.frame_count += 1
+
+        if self.segment_frame_count >= self.segment_frames:
+            self.close_segment()
+
+    def close_segment(self):
+        """
+        release the writer of current segment and add it to manifest.
+        """
+        self.writer.release()
+        self.writer = None
+
+        segment_path = self.get_segment_path(len(self.segments))
+        self.segments.append({
+            "file"        : os.path.basename(segment_path),
+            "first_frame" : self.frame_count - self.segment_frame_count,
+            "frame_count" : self.segment_frame_count
+        })
+        self.write_manifest(complete = False)
+
+        if self.on_segment_complete is not None:
+            self.on_segment_complete(segment_path)
+
+    def write_manifest(self,complete):
+        manifest = {
+            "fps"            : self.fps,
+            "segment_frames" : self.segment_frames,
+            "frame_count"    : self.frame_count,
+            "complete"       : complete,
+            "segments"       : self.segments
+        }
+        # manifest is replaced at once , so a reader never sees a partially written file
+        with open(self.manifest_path + ".tmp","w") as manifest_file:
+            json.dump(manifest,manifest_file,indent = 4)
+        os.replace(self.manifest_path + ".tmp",self.manifest_path)
+
+    def release(self):
+        """
+        close the last (partial) segment and mark the manifest complete.
+        """
+        if self.writer is not None:
+            self.close_segment()
+        self.write_manifest(complete = True)
+
+def load_segment_manifest(video_path):
+    """
+    read the manifest written by SegmentedWriter for the video, None if the video is not segmented.
+    """
+    manifest_path = os.path.splitext(video_path)[0] + ".segments.json"
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path,"r") as manifest_file:
+        return json.load(manifest_file)
+
+class FramePacer:
+    """
+    Keeps the time base of video written at fixed fps with the receive time of frames.
+    frame n of the video is the latest frame received at start + n / fps , so frames are duplicated
+    when camera delivers late and dropped when two frames fall in the same frame interval.
+    """
+
+    def __init__(self,fps):
+
+        self.fps = fps
+        self.start_timestamp = None
+        self.written_count = 0
+        self.duplicated_count = 0
+        self.dropped_count = 0
+
+    def get_repeat_count(self,timestamp):
+        """
+        number of times the frame received at timestamp (monotonic) has to be written, 0 to drop it.
+        """
+        if self.start_timestamp is None:
+            self.start_timestamp = timestamp
+
+        # frames of video which should be written till this frame
+        target_count = int(round((timestamp - self.start_timestamp) * self.fps)) + 1
+        repeat_count = max(0,target_count - self.written_count)
+
+        if repeat_count == 0:
+            self.dropped_count += 1
+        else:
+            self.duplicated_count += repeat_count - 1
+        self.written_count += repeat_count
+
+        return repeat_count
+
+    def get_stats(self):
+        return {
+            "fps"               : self.fps,
+            "frames_duplicated" : self.duplicated_count,
+            "frames_dropped"    : self.dropped_count
+        }
+
 class CameraWriter(ParseParams):
     
     def __init__(self,
                  video_path,
                  width,
                  height,
-                 connected_cams):
+                 connected_cams,
+                 on_segment_complete = None,
+                 record_rois = None):
         
         ParseParams.__init__(self)
         
@@ -21,26 +479,23 @@ class CameraWriter(ParseParams):
         # variable to keep track of number of cameras connected
         self.connected_cams = connected_cams
         
+        # function called with camera name and segment path when a segment is closed in segmented recording
+        self.on_segment_complete = on_segment_complete
+        
+        # camera name -> RecordRoi , region of frame written for cameras not recorded in full frame
+        self.record_rois = record_rois if record_rois is not None else dict()
+        
         self.cam_writer = dict()
+        # container fps of each camera video
+        self.cam_fps = dict()
         
-        if "FrontCam" in self.connected_cams.keys():
-            self.front_cam_writer = cv2.VideoWriter(os.path.join(self.video_path,self.args.front_cam_video_name),
-                                                    self.fourcc,
-                                                    self.fps,
-                                                    (self.width,self.height))
-            self.cam_writer.update({"FrontCam":self.front_cam_writer})
-        if "RightCam" in self.connected_cams.keys():
-            self.right_cam_writer = cv2.VideoWriter(os.path.join(self.video_path,self.args.right_cam_video_name),
-                                                    self.fourcc,
-                                                    self.fps,
-                                                    (self.width,self.height))
-            self.cam_writer.update({"RightCam":self.right_cam_writer})
-        if "LeftCam" in self.connected_cams.keys():
-            self.left_cam_writer = cv2.VideoWriter(os.path.join(self.video_path,self.args.left_cam_video_name),
-                                                self.fourcc,
-                                                self.fps,
-                                                (self.width,self.height))
-            self.cam_writer.update({"LeftCam":self.left_cam_writer})
+        # grab timestamps of FrameSets written , to match the frames of cameras recorded at the same instant
+        self.frame_set_log = []
+        
+        # in paced recording the writers are opened with measured capture fps by open_writer
+        for cam_name in ["FrontCam","RightCam","LeftCam"]:
+            if cam_name in self.connected_cams.keys() and not self.args.paced_recording:
+                self.open_writer(cam_name,self.fps)
         
         # dict to map camera while writing
         # self.cam_writer = {
@@ -50,15 +505,120 @@ class CameraWriter(ParseParams):
         # }
         
         
-    def write_image(self,cam_name,img):
+    def open_writer(self,cam_name,fps):
+        """
+        open the video writer of camera with given container fps, has to be called before first frame of camera is written.
+        """
+        self.cam_fps[cam_name] = fps
+        self.cam_writer[cam_name] = self.get_video_writer(cam_name,fps)
+        
+    def get_frame_size(self,cam_name):
+        """
+        size of frames written for camera, size of region of interest if frames are cropped.
+        """
+        if cam_name in self.record_rois:
+            return self.record_rois[cam_name].get_frame_size()
+        return self.width , self.height
+        
+    def get_stream_writer(self,video_file,fps,frame_size,frame_count):
+        """
+        open the writer of single video file based on record format.
+        """
+        # jpeg payload from camera is written as it is in avi container
+        if self.args.record_format == "mjpeg":
+            return MjpegAviWriter(video_file,fps,frame_size)
+        # frames are stored without encoding , converted to mp4 only when needed
+        if self.args.record_format == "raw":
+            return RawFrameWriter(video_file,fps,frame_size,frame_count)
+        return cv2.VideoWriter(video_file,self.fourcc,fps,frame_size)
+        
+    def get_video_writer(self,cam_name,fps):
+        """
+        open the video writer for given camera based on record format.
+        """
+        video_file = os.path.join(self.video_path,self.get_video_file_name(cam_name))
+        frame_size = self.get_frame_size(cam_name)
+        
+        if self.is_segmented_recording():
+            # video is rolled over into segments which can be played back while recording
+            on_segment_complete = None
+            if self.on_segment_complete is not None:
+                on_segment_complete = lambda segment_path : self.on_segment_complete(cam_name,segment_path)
+            writer = SegmentedWriter(video_file,
+                                     lambda segment_file : self.get_stream_writer(segment_file,fps,frame_size,self.args.segment_frames),
+                                     self.args.segment_frames,
+                                     fps,
+                                     on_segment_complete)
+        else:
+            writer = self.get_stream_writer(video_file,fps,frame_size,self.get_record_frame_count(fps))
+        
+        # encode in background thread of the stream
+        if self.args.async_writer:
+            writer = AsyncStreamWriter(writer,
+                                       queue_size = self.args.writer_queue_size,
+                                       max_stall = self.args.writer_max_stall,
+                                       name = f"{cam_name}Writer")
         
-        self.cam_writer[cam_name].write(img)
+        return writer
         
+    def write_image(self,cam_name,img,timestamp = None):
+        
+        # crop and downscale as a view of the frame , pixels are copied only by the encoder
+        if cam_name in self.record_rois:
+            img = self.record_rois[cam_name].apply(img)
+        
+        # timestamp : monotonic receive time of frame from camera , kept by raw writer
+        write_frame(self.cam_writer[cam_name],img,timestamp)
+        
+        
+    def write_frame_set(self,frame_set):
+        """
+        write the frames of a FrameSet grabbed from all the cameras at the same instant.
+        """
+        for cam_name , frame in frame_set.frames.items():
+            self.write_image(cam_name,frame,frame_set.grab_timestamps[cam_name])
+        
+        self.frame_set_log.append({
+            "seq"             : frame_set.seq,
+            "grab_timestamps" : frame_set.grab_timestamps,
+            "grab_spread_ms"  : frame_set.grab_spread_ms
+        })
+        
+    def flush(self):
+        """
+        wait till all the frames queued in background writers are written.
+        """
+        for writer in self.cam_writer.values():
+            if isinstance(writer,AsyncStreamWriter):
+                writer.flush()
         
     def clear_writer(self):
         # self.front_cam_writer.release()
         # self.right_cam_writer.release()
         # self.left_cam_writer.release()
         
-        for writer in self.cam_writer.values():
-            writer.release()
\ No newline at end of file
+        # queued frames are drained before releasing
+        self.flush()
+        
+        # geometry of original frame for the videos recorded with region of interest
+        for cam_name , record_roi in self.record_rois.items():
+            roi_path = os.path.join(self.video_path,os.path.splitext(self.get_video_file_name(cam_name))[0] + ".roi.json")
+            with open(roi_path,"w") as roi_file:
+                json.dump(record_roi.get_metadata(),roi_file,indent = 4)
+        
+        if len(self.frame_set_log):
+            with open(os.path.join(self.video_path,"FrameSets.json"),"w") as frame_set_file:
+                json.dump(self.frame_set_log,frame_set_file,indent = 4)
+        
+        for cam_name , writer in self.cam_writer.items():
+            writer.release()
+            if isinstance(writer,AsyncStreamWriter):
+                stats = writer.get_stats()
+                self.logger.info(f"{cam_name} writer : written {stats['frames_written']} , dropped {stats['frames_dropped']} , max queue depth {stats['max_queue_depth']} , max stall {stats['max_stall_ms']} ms")
+                
+if __name__ == "__main__":
+    
+    # convert the raw recording to mp4 for archiving : python CamWriter.py FrontCam.npy [FrontCam.mp4]
+    raw_path = sys.argv[1]
+    video_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(raw_path)[0] + ".mp4"
+    convert_raw_to_video(raw_path,video_path)
\ No newline at end of file
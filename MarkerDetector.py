@@ -2,8 +2,13 @@ import cv2
 import numpy 
 
 class ArucoMarkerDetector:
+    """
+    detect aruco markers in frame.
+    detect_scale < 1 : markers are searched in downscaled frame first , then detected again at full resolution only around the candidates found.
+    track_roi : frame is first searched around the markers found in previous frame of the same camera (track_key).
+    """
     
-    def __init__(self,aruco_dict):
+    def __init__(self,aruco_dict,detect_scale = 1.0,track_roi = False,roi_margin = 0.5):
         self.aruco_dict_map = {"DICT_4X4_100"  : cv2.aruco.DICT_4X4_100,
                             "DICT_4X4_1000" : cv2.aruco.DICT_4X4_1000,
                             "DICT_4X4_250"  : cv2.aruco.DICT_4X4_250,
@@ -35,14 +40,142 @@ class ArucoMarkerDetector:
         self.aruco_params = cv2.aruco.DetectorParameters()
         
         self.aruco_detector = cv2.aruco.ArucoDetector(self.aruco_dict,self.aruco_params)
+        
+        ###### coarse to fine detection ######
+        self.detect_scale = detect_scale
+        self.track_roi = track_roi
+        # border added around marker on each side , as fraction of marker size , for quiet zone of marker
+        self.roi_margin = roi_margin
+        # track key -> (x0 , y0 , x1 , y1) of markers found in previous frame
+        self.tracked_rois = dict()
+        ######################################
+        
+        # track key -> grey image buffer reused across frames
+        self.grey_buffers = dict()
+    
+    def get_marker_roi(self,marker_corners,img_w,img_h,scale = 1.0):
+        """
+        bounding box of the marker in full resolution frame with margin around it , clipped to frame.
+        """
+        points = marker_corners.reshape(-1,2) / scale
+        x0 , y0 = points.min(axis = 0)
+        x1 , y1 = points.max(axis = 0)
+        margin = self.roi_margin * max(x1 - x0,y1 - y0)
+        return (max(0,int(x0 - margin)),max(0,int(y0 - margin)),
+                min(img_w,int(numpy.ceil(x1 + margin))),min(img_h,int(numpy.ceil(y1 + margin))))
+    
+    def get_markers_roi(self,corners,img_w,img_h):
+        """
+        region covering all the markers with margin.
+        """
+        return self.get_marker_roi(numpy.concatenate([marker_corners.reshape(-1,2) for marker_corners in corners]),img_w,img_h)
+    
+    def detect_markers_in_roi(self,img_gray,roi):
+        """
+        detect markers in region of frame , corners are returned in frame coordinates.
+        """
+        x0 , y0 , x1 , y1 = roi
+        corners , ids , _ = self.aruco_detector.detectMarkers(img_gray[y0:y1,x0:x1])
+        offset = numpy.array([x0,y0],dtype = numpy.float32)
+        return tuple(marker_corners + offset for marker_corners in corners) , ids
+    
+    def detect_markers_coarse_to_fine(self,img_gray):
+        """
+        detect markers in downscaled frame , each candidate is detected again in its region at full resolution for accurate corners.
+        candidate whose region has no marker at full resolution is kept with corners from downscaled frame.
+        """
+        img_h , img_w = img_gray.shape[:2]
+        img_small = cv2.resize(img_gray,None,fx = self.detect_scale,fy = self.detect_scale,interpolation = cv2.INTER_AREA)
+        coarse_corners , coarse_ids , coarse_rejected = self.aruco_detector.detectMarkers(img_small)
+        rejected_img_points = tuple(marker_corners / self.detect_scale for marker_corners in coarse_rejected)
+        
+        if coarse_ids is None:
+            return coarse_corners , None , rejected_img_points
+        
+        corners , ids = [] , []
+        for marker_corners , marker_id in zip(coarse_corners,coarse_ids):
+            roi_corners , roi_ids = self.detect_markers_in_roi(img_gray,self.get_marker_roi(marker_corners,img_w,img_h,self.detect_scale))
+            roi_ids = [] if roi_ids is None else list(roi_ids.flatten())
+            if marker_id[0] in roi_ids:
+                corners.append(roi_corners[roi_ids.index(marker_id[0])])
+            else:
+                corners.append(marker_corners / self.detect_scale)
+            ids.append(marker_id)
+        
+        return tuple(corners) , numpy.array(ids,dtype = coarse_ids.dtype) , rejected_img_points
     
-    def get_marker_id(self,img):
+    def detect_markers(self,img_gray,track_key = None):
+        """
+        detect markers with the search enabled , same return as cv2.aruco.ArucoDetector.detectMarkers.
+        """
+        img_h , img_w = img_gray.shape[:2]
         
-        img_gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
+        # marker is usually where it was in previous frame , search there first
+        if self.track_roi and track_key in self.tracked_rois:
+            corners , ids = self.detect_markers_in_roi(img_gray,self.tracked_rois[track_key])
+            if ids is not None:
+                self.tracked_rois[track_key] = self.get_markers_roi(corners,img_w,img_h)
+                return corners , ids , ()
+            del self.tracked_rois[track_key]
+        
+        if self.detect_scale < 1.0:
+            corners , ids , rejected_img_points = self.detect_markers_coarse_to_fine(img_gray)
+        else:
+            corners , ids , rejected_img_points = self.aruco_detector.detectMarkers(img_gray)
+        
+        if self.track_roi and track_key is not None and ids is not None:
+            self.tracked_rois[track_key] = self.get_markers_roi(corners,img_w,img_h)
+        
+        return corners , ids , rejected_img_points
+    
+    def get_grey_image(self,img,track_key = None,frame_size = None):
+        """
+        grey image of frame to detect markers in.
+        grey frame or luma plane is used as it is , packed yuyv frame (from passthrough capture) gives its luma channel,
+        bgr frame is converted into buffer reused for every frame of the track key.
+        frame_size : (width , height) of frame , to read the yuyv frame delivered as flat buffer.
+        """
+        if frame_size is not None and img.ndim < 3 and img.size == frame_size[0] * frame_size[1] * 2:
+            img = img.reshape(frame_size[1],frame_size[0],2)
+        if img.ndim == 2:
+            return img
+        
+        img_gray = self.grey_buffers.get(track_key)
+        if img_gray is None or img_gray.shape != img.shape[:2]:
+            img_gray = numpy.empty(img.shape[:2],dtype = numpy.uint8)
+            self.grey_buffers[track_key] = img_gray
+        
+        if img.shape[2] == 2:
+            # yuyv : luma is the first byte of every pixel
+            cv2.extractChannel(img,0,dst = img_gray)
+        else:
+            cv2.cvtColor(img,cv2.COLOR_BGR2GRAY,dst = img_gray)
+        return img_gray
+    
+    def detect_marker_ids(self,img,track_key = None,frame_size = None):
+        """
+        detect markers without annotating the frame, returns (corners , ids , rejected_img_points).
+        """
+        img_gray = self.get_grey_image(img,track_key,frame_size)
+        return self.detect_markers(img_gray,track_key)
+    
+    def annotate_markers(self,img,corners,ids):
+        """
+        copy of bgr frame with detected markers drawn , for preview.
+        """
+        if img.ndim == 2:
+            annotated_image = cv2.cvtColor(img,cv2.COLOR_GRAY2BGR)
+        elif img.shape[2] == 2:
+            annotated_image = cv2.cvtColor(img,cv2.COLOR_YUV2BGR_YUYV)
+        else:
+            annotated_image = img.copy()
+        return cv2.aruco.drawDetectedMarkers(annotated_image,corners,ids)
+    
+    def get_marker_id(self,img,track_key = None):
         
-        corners,ids,rejected_img_points = self.aruco_detector.detectMarkers(img_gray)
+        corners,ids,rejected_img_points = self.detect_marker_ids(img,track_key)
         
         # Draw detected markers
-        annotated_image = cv2.aruco.drawDetectedMarkers(img.copy(),corners,ids)
+        annotated_image = self.annotate_markers(img,corners,ids)
         
-        return corners , ids , rejected_img_points , annotated_image
\ No newline at end of file
+        return corners , ids , rejected_img_points , annotated_image
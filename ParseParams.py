@@ -2,6 +2,7 @@ import argparse
 import logging
 import os
 import json
+import math
 
 from CameraStartUpJsonTemplate import *
 
@@ -17,13 +18,51 @@ class ParseParams:
         parser.add_argument("--json_path",default = "/home/pi/CameraStartUpJson.json",help = "path to json file for read,modify and updating the params. (default : /home/pi/CameraStartUpJson.json)")
         parser.add_argument("--n_cam",type = int ,default = 3,help = "number of cameras connected to bot (default : 3)")
         parser.add_argument("--resolution",type = int, default = 1 , help = "resoultion of image to get from camera. (default : 1) \n supported resolution \n 0 : (640,480) \n 1 : (960,540) \n 2 : (1280,720) \n 3 : (1280,960) \n 4 : (1920,1080)")
+        parser.add_argument("--auto_resolution",action="store_true",help = "use the highest resolution all the cameras have sustained together in benchmark (python CamBenchmark.py) , falls back to --resolution if cameras are not benchmarked on current ports")
+        parser.add_argument("--benchmark_cache",type = str,default = "/home/pi/CameraBenchmark.json",help = "path to json file with cached camera benchmark results. (default : /home/pi/CameraBenchmark.json)")
+        
+        parser.add_argument("--pixel_format",type = str,default = None,choices = ["MJPG","YUYV"],help = "pixel format to request from camera. (default : None , pixel format from capture profile of camera model)")
         
         #### params related to marker detection #####
         parser.add_argument("--aruco_dict",type = str , default = "DICT_4X4_50",help = "Aruco Dictionary family used for detection. (default : DICT_4X4_50)")
+        parser.add_argument("--detect_scale",type = float,default = 1.0,help = "scale of frame markers are searched in , candidates are detected again at full resolution around them. (default : 1.0 , search full resolution frame)")
+        parser.add_argument("--track_marker_roi",action="store_true",help = "search the marker around where it was found in previous frame of the camera before searching whole frame")
         parser.add_argument("--front_cam_marker_id",type = int , default = 0 , help = "marker id for front camera. (default : 0)")
         parser.add_argument("--right_cam_marker_id",type = int , default = 1 , help = "marker id for right camra. (default : 1)")
         parser.add_argument("--left_cam_marker_id",type = int , default = 2, help = "marker id for left camera. (default : 2)")
         parser.add_argument("--record_frame_count",type = int,default = 100,help = "number of frames to record as video. (default : 100)")
+        parser.add_argument("--paced_recording",action="store_true",help = "write the video at measured capture fps , frames are duplicated or dropped with their timestamps so the video keeps real time")
+        parser.add_argument("--record_duration",type = float,default = None,help = "seconds of video to record in paced recording instead of record_frame_count. (default : None)")
+        parser.add_argument("--preroll_seconds",type = float,default = 0,help = "seconds of frames to keep in memory for each camera from bot placement, recording starts with these frames. (default : 0 , disabled) \n note : each second keeps fps number of full frames per camera in memory , not available with --sync_capture")
+        parser.add_argument("--max_warmup_frames",type = int,default = 30,help = "max number of frames to skip while waiting for camera to give valid frames with stable exposure. (default : 30)")
+        parser.add_argument("--quality_gate",type = str,default = "off",choices = ["off","reject","tag"],help = "check blur , exposure and frozen frames while recording. (default : off) \n reject : bad frames are not written , recording continues till enough good frames \n tag : all frames are written , bad frames are listed in <cam>.quality.json")
+        parser.add_argument("--min_sharpness",type = float,default = 10.0,help = "min variance of laplacian of downscaled grey frame , frames below are considered blurred. (default : 10.0)")
+        parser.add_argument("--max_rejected_frames",type = int,default = 200,help = "max number of frames rejected by quality gate for a camera before recording is stopped. (default : 200)")
+        parser.add_argument("--record_format",type = str,default = "mp4",choices = ["mp4","mjpeg","raw"],help = "format of recorded video. (default : mp4) \n mp4 : frames are decoded and encoded as mp4v \n mjpeg : jpeg payload from camera is written as it is in avi container \n raw : frames are written without encoding in memory mapped .npy file, converted to mp4 for VideoPlayback")
+        parser.add_argument("--async_writer",action="store_true",help = "encode the recorded frames in a background thread for each camera")
+        parser.add_argument("--writer_queue_size",type = int,default = 30,help = "number of frames that can wait for encoding in async writer. (default : 30)")
+        parser.add_argument("--writer_max_stall",type = float,default = 1.0,help = "seconds to wait for a free slot in async writer before dropping the frame. (default : 1.0)")
+        parser.add_argument("--sync_capture",action="store_true",help = "record all the cameras with frames grabbed at the same instant (grab on all cameras , then retrieve)")
+        parser.add_argument("--capture_processes",action="store_true",help = "capture each camera in its own process , frames are shared through shared memory to spread capture and decode over all the cores")
+        parser.add_argument("--concurrent_recording",action="store_true",help = "record all the cameras at the same time instead of one after another")
+        parser.add_argument("--open_timeout",type = float,default = 10.0,help = "seconds to wait for a camera to open and negotiate its format. (default : 10.0)")
+        parser.add_argument("--first_frame_timeout",type = float,default = 5.0,help = "seconds to wait for first frame from a camera after it is opened. (default : 5.0)")
+        parser.add_argument("--mapping_timeout",type = float,default = 60.0,help = "seconds to wait for the marker to be detected in a camera during camera id mapping. (default : 60.0)")
+        parser.add_argument("--mapping_deadline",type = float,default = 120.0,help = "seconds to map all the cameras , cameras not mapped by then are given up. (default : 120.0)")
+        parser.add_argument("--mapping_window",type = int,default = 10,help = "number of last frames of a camera its marker is voted over during camera id mapping. (default : 10)")
+        parser.add_argument("--mapping_votes",type = int,default = 3,help = "number of frames in window which have to show the same marker to map the camera. (default : 3)")
+        parser.add_argument("--mapping_batch",type = int,default = 4,help = "max number of frames read from a camera at once for detection during camera id mapping. (default : 4)")
+        parser.add_argument("--on_camera_timeout",type = str,default = "abort",choices = ["abort","skip"],help = "what to do with a camera which has not responded within its timeout. (default : abort) \n abort : stop the run with error \n skip : continue without the camera , only FrontCam (frontCameraId in CameraStartUpJson) can be skipped")
+        parser.add_argument("--reconnect_timeout",type = float,default = 10.0,help = "seconds to retry a camera which stopped delivering frames before giving up. (default : 10.0)")
+        parser.add_argument("--staging_dir",type = str,default = None,help = "record the videos in this directory (tmpfs like /dev/shm) and run VideoPlayback from it , files are copied to data dir in background. (default : None , record in data dir)")
+        parser.add_argument("--staging_bandwidth",type = float,default = 20,help = "max MB/s used to copy the staged files to data dir. (default : 20)")
+        parser.add_argument("--record_roi",action="store_true",help = "record only the region of interest of each camera , at the scale set for BotType in RecordRoiProfile.json next to CameraStartUpJson (created with full frame if not present)")
+        parser.add_argument("--roi_profile_path",type = str,default = None,help = "path to RecordRoiProfile.json. (default : None , next to CameraStartUpJson)")
+        parser.add_argument("--segment_frames",type = int,default = 0,help = "record the videos in segments of this many frames , VideoPlayback runs on completed segments while the next camera is recording. (default : 0 , disabled) \n note : not used with raw record format and in debug mode")
+        parser.add_argument("--lock_controls",action="store_true",help = "open the cameras with exposure , gain and white balance locked at the values auto mode has settled at , kept per serial number in CameraControls.json next to CameraStartUpJson. \n cameras without locked values are converged in auto mode once while opening")
+        parser.add_argument("--relock_controls",action="store_true",help = "converge and lock the controls of all the cameras again , for changed lighting of calibration area (used with --lock_controls)")
+        parser.add_argument("--controls_path",type = str,default = None,help = "path to CameraControls.json with locked controls of cameras. (default : None , next to CameraStartUpJson)")
+        parser.add_argument("--max_converge_frames",type = int,default = 60,help = "max frames to wait for auto exposure and white balance to settle before locking. (default : 60)")
         parser.add_argument("--videoplayback_build",type=str,default = None,help = "path to VideoPlayback build. (default : None)")
         
         #### threshold params for ratio and csa ####
@@ -57,10 +96,23 @@ class ParseParams:
         parser.add_argument("--front_cam_video_name",type=str,default="FrontCam.mp4",help= "Video file name for front cam")
         ##########################
         
+        #### params to run without user input (station slot) ####
+        parser.add_argument("--serials",type = str,default = None,help = "comma separated serial numbers of cameras of the bot , other cameras connected to host are not used. (default : None , all cameras)")
+        parser.add_argument("--bot_type",type = int,default = None,choices = [1,2],help = "BotType to update in CameraStartUpJson. (default : None , asked from user)")
+        parser.add_argument("--path_width",type = int,default = None,help = "PathWidth in cm to update in CameraStartUpJson. (default : None , asked from user)")
+        parser.add_argument("--lane_colour",type = int,default = None,help = "LaneColourToScan to update in CameraStartUpJson. (default : None , asked from user)")
+        parser.add_argument("--non_interactive",action="store_true",help = "take backup of CameraStartUpJson and assume bot is placed without asking user")
+        parser.add_argument("--recording_done_path",type = str,default = None,help = "file created once recording is done and cameras are released, station starts next slot on the usb bus when it appears. (default : None)")
+        ##########################################################
+        
         ## param to print offsets in all three stages
         parser.add_argument("--debug_print",action="store_true",help="param to print offsets in all three stages")
         
         self.args = parser.parse_args()
+
+        # pre-roll grabbers are stopped when the cameras are opened again for synchronized grabbing, so pre-roll frames would be lost
+        if self.args.sync_capture and self.args.preroll_seconds > 0:
+            parser.error("--preroll_seconds can not be used with --sync_capture")
         
         # resolution of camera #
         self.cam_res_dict = {
@@ -72,6 +124,50 @@ class ParseParams:
         }
         self.w , self.h = self.cam_res_dict[self.args.resolution]
         
+        # container extension of recorded video for each record format
+        self.video_ext_dict = {
+            "mp4"   : ".mp4",
+            "mjpeg" : ".avi",
+            "raw"   : ".npy"
+        }
+        # extension of video given to VideoPlayback build for each record format
+        self.playback_ext_dict = {
+            "mp4"   : ".mp4",
+            "mjpeg" : ".avi",
+            "raw"   : ".mp4"
+        }
+        
+    def get_video_file_name(self,cam_name,playback = False):
+        """
+        function to get the video file name of camera with extension of record format.
+        playback : True to get the name of video given to VideoPlayback build.
+        """
+        video_name = {
+            "FrontCam" : self.args.front_cam_video_name,
+            "RightCam" : self.args.right_cam_video_name,
+            "LeftCam"  : self.args.left_cam_video_name
+        }[cam_name]
+        
+        ext_dict = self.playback_ext_dict if playback else self.video_ext_dict
+        
+        return os.path.splitext(video_name)[0] + ext_dict[self.args.record_format]
+        
+        
+    def get_record_frame_count(self,fps = None):
+        """
+        function to get the number of frames to record for each camera, from record_duration in paced recording.
+        fps : container fps of video
+        """
+        if self.args.paced_recording and self.args.record_duration is not None and fps:
+            return math.ceil(self.args.record_duration * fps)
+        
+        return self.args.record_frame_count
+        
+    def is_segmented_recording(self):
+        """
+        function to check if the videos are recorded in segments, raw recordings have to be converted before playback so they are not segmented.
+        """
+        return self.args.segment_frames > 0 and self.args.record_format != "raw" and not self.args.debug
         
     def check_params(self):
         """